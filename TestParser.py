@@ -1,12 +1,339 @@
+import os
+import time
+import codecs
+import locale
+import functools
+import threading
+from collections import OrderedDict
 from tree_sitter import Language, Parser
 from typing import List, Dict, Any, Set, Optional
 
+# Tree-sitter queries used by TestParser
+QUERIES = {
+	'invocations': '(method_invocation name: (identifier)) @invocation',
+}
+
+# Queries compiled once per Language: (grammar_file, language) -> {name: Query}
+_compiled_queries = {}
+
+
+def get_queries(grammar_file, language, tree_sitter_language):
+	"""
+	Return the compiled QUERIES of a language, compiling them on first use
+	"""
+	key = (grammar_file, language)
+	if key not in _compiled_queries:
+		_compiled_queries[key] = {name: tree_sitter_language.query(query) for name, query in QUERIES.items()}
+	return _compiled_queries[key]
+
+
+class SourceBuffer():
+	"""
+	Source code of a parsed file, shared by all the TestParser methods.
+	Spans are sliced from a single bytes buffer using node.start_byte/end_byte;
+	the line table is only built for spans given as (row, column) points.
+	"""
+
+	def __init__(self, source: bytes):
+		self.source = source
+		self._line_starts = None
+
+	@classmethod
+	def from_text(cls, text: str):
+		return cls(bytes(text, "utf8"))
+
+	def text(self, start_byte: int, end_byte: int) -> str:
+		return self.source[start_byte:end_byte].decode("utf8")
+
+	def line_starts(self) -> List[int]:
+		"""
+		Byte offset of the start of every line
+		"""
+		if self._line_starts is None:
+			starts = [0]
+			index = self.source.find(b'\n')
+			while index != -1:
+				starts.append(index + 1)
+				index = self.source.find(b'\n', index + 1)
+			self._line_starts = starts
+		return self._line_starts
+
+	def offset(self, point) -> int:
+		"""
+		Byte offset of a tree-sitter point (row, byte column)
+		"""
+		row, column = point
+		return self.line_starts()[row] + column
+
+	def byte_range(self, node):
+		"""
+		(start_byte, end_byte) of a node, computed from its points if it has no byte offsets
+		"""
+		start_byte = getattr(node, 'start_byte', None)
+		end_byte = getattr(node, 'end_byte', None)
+		if start_byte is None or end_byte is None:
+			start_byte = self.offset(node.start_point)
+			end_byte = self.offset(node.end_point)
+		return start_byte, end_byte
+
+	def span(self, node) -> str:
+		"""
+		Source code of a node, by byte offsets or, without them, by points
+		"""
+		return self.text(*self.byte_range(node))
+
+
+class MethodRecord():
+	"""
+	Metadata of a method or constructor.
+	The body and the invocation names are kept as byte ranges of the SourceBuffer and
+	only decoded when accessed; the signature variants are computed on access.
+	class_info is set by the mapping stage to the metadata of the enclosing class.
+	"""
+
+	__slots__ = ('identifier', 'parameters', 'modifiers', 'return_type', 'class_name', 'testcase', 'constructor',
+				 'class_info', 'source', 'body_range', 'invocation_ranges', '_body', '_invocations')
+
+	def __init__(self, class_name, source: Optional[SourceBuffer] = None, body_range=None, invocation_ranges=None):
+		self.identifier = ''
+		self.parameters = ''
+		self.modifiers = ''
+		self.return_type = ''
+		self.class_name = class_name
+		self.testcase = False
+		self.constructor = False
+		self.class_info = None
+		self.source = source
+		self.body_range = body_range
+		self.invocation_ranges = invocation_ranges
+		self._body = None
+		self._invocations = None
+
+	@property
+	def body(self) -> str:
+		if self._body is None:
+			self._body = self.source.text(*self.body_range)
+		return self._body
+
+	@property
+	def invocations(self) -> List[str]:
+		if self._invocations is None:
+			self._invocations = [self.source.text(start, end) for start, end in self.invocation_ranges]
+		return self._invocations
+
+	@property
+	def signature(self) -> str:
+		return '{} {}{}'.format(self.return_type, self.identifier, self.parameters)
+
+	@property
+	def full_signature(self) -> str:
+		return '{} {} {}{}'.format(self.modifiers, self.return_type, self.identifier, self.parameters)
+
+	@property
+	def class_method_signature(self) -> str:
+		return '{}.{}{}'.format(self.class_name, self.identifier, self.parameters)
+
+	def to_dict(self) -> Dict[str, Any]:
+		"""
+		Plain dict with the keys of the former metadata dict (used by the persistent caches)
+		"""
+		return {
+			'identifier': self.identifier,
+			'parameters': self.parameters,
+			'modifiers': self.modifiers,
+			'return': self.return_type,
+			'body': self.body,
+			'class': self.class_name,
+			'signature': self.signature,
+			'full_signature': self.full_signature,
+			'class_method_signature': self.class_method_signature,
+			'testcase': self.testcase,
+			'constructor': self.constructor,
+			'invocations': self.invocations,
+		}
+
+	@classmethod
+	def from_dict(cls, data: Dict[str, Any]):
+		record = cls(data['class'])
+		record.identifier = data['identifier']
+		record.parameters = data['parameters']
+		record.modifiers = data['modifiers']
+		record.return_type = data['return']
+		record.testcase = data['testcase']
+		record.constructor = data['constructor']
+		record._body = data['body']
+		record._invocations = data['invocations']
+		return record
+
+
+def classes_to_dicts(parsed_classes):
+	"""
+	Convert the output of TestParser.parse_file to plain JSON-serializable dicts
+	"""
+	return [dict(parsed_class, methods=[method.to_dict() for method in parsed_class['methods']])
+			for parsed_class in parsed_classes]
+
+
+def classes_from_dicts(data):
+	"""
+	Inverse of classes_to_dicts
+	"""
+	return [dict(parsed_class, methods=[MethodRecord.from_dict(method) for method in parsed_class['methods']])
+			for parsed_class in data]
+
+
+class ParsedFile():
+	"""
+	A parsed source file: the SourceBuffer, the tree and, once extracted, the parse_file records
+	derived holds other results computed from the tree (e.g. method signatures) by name
+	"""
+
+	__slots__ = ('stamp', 'read_at', 'source', 'tree', 'classes', 'derived', 'cost')
+
+	def __init__(self, stamp, read_at, source: SourceBuffer, tree):
+		self.stamp = stamp
+		self.read_at = read_at
+		self.source = source
+		self.tree = tree
+		self.classes = None
+		self.derived = {}
+		# Trees and records are not measurable from Python, estimate them from the source size
+		self.cost = len(source.source) * ParseCache.COST_PER_SOURCE_BYTE
+
+
+class ParseCache():
+	"""
+	Bounded LRU cache of parsed files keyed by (path, encoding) and validated by (mtime, size),
+	so a file is read and parsed at most once per run while it does not change.
+	max_bytes bounds the estimated memory held (source, tree and method records).
+	Encodings are keyed by their codec name ('UTF8' and 'utf-8' are the same entry), and
+	pure-ASCII files are keyed by ASCII: they decode the same in every ASCII-compatible
+	encoding, so readers using the locale encoding and UTF-8 share them.
+	"""
+
+	ASCII = 'ascii'
+
+	# Estimated bytes held per byte of source (tree-sitter nodes plus extracted records)
+	COST_PER_SOURCE_BYTE = 16
+
+	# A file modified this close to the moment it was read may change again without a new
+	# mtime (timestamp granularity), so its entry is not trusted
+	RACY_NS = 2 * 10**9
+
+	def __init__(self, max_bytes=512 * 1024 * 1024):
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.total = 0
+		self.lock = threading.Lock()
+
+	@staticmethod
+	def key(file, encoding):
+		return os.path.abspath(file), codecs.lookup(encoding).name
+
+	@staticmethod
+	@functools.lru_cache(maxsize=None)
+	def ascii_compatible(encoding):
+		"""
+		True if the encoding decodes the 128 ASCII bytes as ASCII
+		"""
+		ascii_bytes = bytes(range(128))
+		try:
+			return ascii_bytes.decode(encoding) == ascii_bytes.decode(ParseCache.ASCII)
+		except (LookupError, UnicodeDecodeError):
+			return False
+
+	@staticmethod
+	def stamp(file):
+		stat = os.stat(file)
+		return stat.st_mtime_ns, stat.st_size
+
+	def get(self, file, encoding):
+		"""
+		Return the cached ParsedFile of file, or None if missing or stale
+		"""
+		keys = [self.key(file, encoding)]
+		if self.ascii_compatible(keys[0][1]):
+			keys.append(self.key(file, self.ASCII))
+		stamp = self.stamp(file)
+		with self.lock:
+			for key in keys:
+				entry = self.entries.get(key)
+				if entry is None:
+					continue
+				if entry.stamp != stamp or entry.read_at - stamp[0] < self.RACY_NS:
+					self.total -= self.entries.pop(key).cost
+					continue
+				self.entries.move_to_end(key)
+				return entry
+		return None
+
+	def put(self, file, encoding, entry):
+		key = self.key(file, encoding)
+		if self.ascii_compatible(key[1]) and entry.source.source.isascii():
+			key = self.key(file, self.ASCII)
+		with self.lock:
+			if key in self.entries:
+				self.total -= self.entries.pop(key).cost
+			if entry.cost > self.max_bytes:
+				return
+			self.entries[key] = entry
+			self.total += entry.cost
+			while self.total > self.max_bytes:
+				_, evicted = self.entries.popitem(last=False)
+				self.total -= evicted.cost
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.total = 0
+
+
+# Parse cache shared by every TestParser of the process
+_parse_cache = ParseCache()
+
+
+def get_parse_cache():
+	return _parse_cache
+
+
+def configure_parse_cache(max_bytes):
+	"""
+	Change the memory budget of the shared parse cache (0 disables it)
+	"""
+	_parse_cache.max_bytes = max_bytes
+	_parse_cache.clear()
+
+
 class TestParser():
 	
 	def __init__(self, grammar_file, language):
 		JAVA_LANGUAGE = Language(grammar_file, language)
 		self.parser = Parser()
 		self.parser.set_language(JAVA_LANGUAGE)
+		self.language = JAVA_LANGUAGE
+		self.queries = get_queries(grammar_file, language, JAVA_LANGUAGE)
+		self.cache = get_parse_cache()
+
+
+	def parse_tree(self, file, encoding=None):
+		"""
+		Read and parse a file, or return it from the shared parse cache if it did not change
+		Returns a ParsedFile
+		"""
+		# Same default as open(), named explicitly so both spellings share a cache entry
+		encoding = encoding or locale.getpreferredencoding(False)
+		entry = self.cache.get(file, encoding)
+		if entry is not None:
+			return entry
+
+		stamp = ParseCache.stamp(file)
+		read_at = time.time_ns()
+		with open(file, 'r', encoding=encoding) as content_file:
+			content = content_file.read()
+		source = SourceBuffer.from_text(content)
+		entry = ParsedFile(stamp, read_at, source, self.parser.parse(source.source))
+		self.cache.put(file, encoding, entry)
+		return entry
 
 
 	def parse_file(self, file):
@@ -15,13 +342,15 @@ class TestParser():
 		"""
 
 		#Build Tree
-		with open(file, 'r') as content_file:
-			try: 
-				content = content_file.read()
-				self.content = content
-			except:
-				return list()
-		tree = self.parser.parse(bytes(content, "utf8"))
+		try:
+			parsed_file = self.parse_tree(file)
+		except ValueError:
+			# Undecodable content
+			return list()
+		if parsed_file.classes is not None:
+			return parsed_file.classes
+		source = parsed_file.source
+		tree = parsed_file.tree
 		classes = (node for node in tree.root_node.children if node.type == 'class_declaration')
 		#print(tree.root_node.sexp())
 		
@@ -32,8 +361,8 @@ class TestParser():
 		for _class in classes:
 
 			#Class metadata
-			class_identifier = self.match_from_span([child for child in _class.children if child.type == 'identifier'][0], content).strip()
-			class_metadata = self.get_class_metadata(_class, content)
+			class_identifier = self.match_from_span([child for child in _class.children if child.type == 'identifier'][0], source).strip()
+			class_metadata = self.get_class_metadata(_class, source)
 
 			methods = list()
 
@@ -43,18 +372,19 @@ class TestParser():
 					if node.type == 'method_declaration' or node.type == 'constructor_declaration':	
 						
 						#Read Method metadata
-						method_metadata = TestParser.get_function_metadata(class_identifier, node, content)
+						method_metadata = TestParser.get_function_metadata(class_identifier, node, source, self.queries)
 						methods.append(method_metadata)
 
 			class_metadata['methods'] = methods
 			parsed_classes.append(class_metadata)
 
+		parsed_file.classes = parsed_classes
 		return parsed_classes
 
 
 
 	@staticmethod
-	def get_class_metadata(class_node, blob: str):
+	def get_class_metadata(class_node, blob: SourceBuffer):
 		"""
 		Extract class-level metadata 
 		"""
@@ -98,7 +428,7 @@ class TestParser():
 
 
 	@staticmethod
-	def get_class_fields(class_node, blob: str):
+	def get_class_fields(class_node, blob: SourceBuffer):
 		"""
 		Extract metadata for all the fields defined in the class
 		"""
@@ -139,73 +469,51 @@ class TestParser():
 
 
 	@staticmethod
-	def get_function_metadata(class_identifier, function_node, blob: str):
+	def get_function_metadata(class_identifier, function_node, blob: SourceBuffer, queries: Optional[Dict] = None):
 		"""
-		Extract method-level metadata 
-		"""		
-		metadata = {
-			'identifier': '',
-			'parameters': '',
-			'modifiers': '',
-			'return' : '',
-			'body': '',
-			'class': '',
-			'signature': '',
-			'full_signature': '',
-			'class_method_signature': '',
-			'testcase': '',
-			'constructor': '',
-		}
+		Extract method-level metadata as a MethodRecord
+		Method invocations come from the compiled queries if given, otherwise from traverse_type
+		"""
+		if isinstance(blob, str):
+			blob = SourceBuffer.from_text(blob)
 
-		# Parameters
-		declarators = []
-		TestParser.traverse_type(function_node, declarators, '{}_declaration'.format(function_node.type.split('_')[0]))
+		#Method Invocations (byte ranges of the invoked names)
+		if queries is not None and function_node.type == 'method_declaration':
+			invocation = [inv for inv, _ in queries['invocations'].captures(function_node)]
+		else:
+			invocation = []
+			TestParser.traverse_type(function_node, invocation, '{}_invocation'.format(function_node.type.split('_')[0]))
+		invocation_ranges = [blob.byte_range(inv.child_by_field_name('name')) for inv in invocation]
+
+		#Body
+		metadata = MethodRecord(class_identifier, blob, blob.byte_range(function_node), invocation_ranges)
+
+		# Parameters (the declarator is the method/constructor declaration itself)
 		parameters = []
-		for n in declarators[0].children:
+		for n in function_node.children:
 			if n.type == 'identifier':
-				metadata['identifier'] = TestParser.match_from_span(n, blob).strip('(')
+				metadata.identifier = TestParser.match_from_span(n, blob).strip('(')
 			elif n.type == 'formal_parameters':
 				parameters.append(TestParser.match_from_span(n, blob))
-		metadata['parameters'] = ' '.join(parameters)
-
-		#Body
-		metadata['body'] = TestParser.match_from_span(function_node, blob)
-		metadata['class'] = class_identifier
+		metadata.parameters = ' '.join(parameters)
 
 		#Constructor
-		metadata['constructor'] = False
 		if "constructor" in function_node.type:
-			metadata['constructor'] = True
+			metadata.constructor = True
 
 		#Test Case
 		modifiers_node_list = TestParser.children_of_type(function_node, "modifiers")
-		metadata['testcase'] = False
 		for m in modifiers_node_list:
 			modifier = TestParser.match_from_span(m, blob)
 			if '@Test' in modifier:
-				metadata['testcase'] = True
-
-		#Method Invocations
-		invocation = []
-		method_invocations = list()
-		TestParser.traverse_type(function_node, invocation, '{}_invocation'.format(function_node.type.split('_')[0]))
-		for inv in invocation:
-			name = inv.child_by_field_name('name')
-			method_invocation = TestParser.match_from_span(name, blob)
-			method_invocations.append(method_invocation)
-		metadata['invocations'] = method_invocations
+				metadata.testcase = True
 
 		#Modifiers and Return Value
 		for child in function_node.children:
 			if child.type == "modifiers":
-				metadata['modifiers']  = ' '.join(TestParser.match_from_span(child, blob).split())
+				metadata.modifiers = ' '.join(TestParser.match_from_span(child, blob).split())
 			if("type" in child.type):
-				metadata['return'] = TestParser.match_from_span(child, blob)
-		
-		#Signature
-		metadata['signature'] = '{} {}{}'.format(metadata['return'], metadata['identifier'], metadata['parameters'])
-		metadata['full_signature'] = '{} {} {}{}'.format(metadata['modifiers'], metadata['return'], metadata['identifier'], metadata['parameters'])
-		metadata['class_method_signature'] = '{}.{}{}'.format(class_identifier, metadata['identifier'], metadata['parameters'])
+				metadata.return_type = TestParser.match_from_span(child, blob)
 
 		return metadata
 
@@ -216,10 +524,9 @@ class TestParser():
 		"""
 
 		#Build Tree
-		with open(file, 'r') as content_file: 
-			content = content_file.read()
-			self.content = content
-		tree = self.parser.parse(bytes(content, "utf8"))
+		parsed_file = self.parse_tree(file)
+		source = parsed_file.source
+		tree = parsed_file.tree
 		classes = (node for node in tree.root_node.children if node.type == 'class_declaration')
 
 		#Method names
@@ -234,51 +541,43 @@ class TestParser():
 						if not TestParser.is_method_body_empty(node):
 							
 							#Method Name
-							method_name = TestParser.get_function_name(node, content)
+							method_name = TestParser.get_function_name(node, source)
 							method_names.append(method_name)
 
 		return method_names
 
 
 	@staticmethod
-	def get_function_name(function_node, blob: str):
+	def get_function_name(function_node, blob: SourceBuffer):
 		"""
 		Extract method name
 		"""
-		declarators = []
-		TestParser.traverse_type(function_node, declarators, '{}_declaration'.format(function_node.type.split('_')[0]))
-		for n in declarators[0].children:
+		for n in function_node.children:
 			if n.type == 'identifier':
 				return TestParser.match_from_span(n, blob).strip('(')
 
 
 	@staticmethod
-	def match_from_span(node, blob: str) -> str:
+	def match_from_span(node, blob: SourceBuffer) -> str:
 		"""
 		Extract the source code associated with a node of the tree
 		"""
-		line_start = node.start_point[0]
-		line_end = node.end_point[0]
-		char_start = node.start_point[1]
-		char_end = node.end_point[1]
-		lines = blob.split('\n')
-		if line_start != line_end:
-			return '\n'.join([lines[line_start][char_start:]] + lines[line_start+1:line_end] + [lines[line_end][:char_end]])
-		else:
-			return lines[line_start][char_start:char_end]
+		if isinstance(blob, str):
+			blob = SourceBuffer.from_text(blob)
+		return blob.span(node)
 
 
 	@staticmethod
 	def traverse_type(node, results: List, kind: str) -> None:
 		"""
-		Traverses nodes of given type and save in results
+		Traverses nodes of given type and save in results (pre-order, without recursion)
 		"""
-		if node.type == kind:
-			results.append(node)
-		if not node.children:
-			return
-		for n in node.children:
-			TestParser.traverse_type(n, results, kind)
+		stack = [node]
+		while stack:
+			node = stack.pop()
+			if node.type == kind:
+				results.append(node)
+			stack.extend(reversed(node.children))
 
 
 	@staticmethod
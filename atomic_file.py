@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+
+def write_atomic(path, content):
+    """
+    写入文本文件：先写同目录下的临时文件再替换，中断或多个线程同时写时不会留下不完整的文件。
+
+    参数:
+        path (str): 文件路径，所在目录不存在时自动创建。
+        content (str): 文件内容，按utf-8原样写入（不转换换行符）。
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
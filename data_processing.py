@@ -1,11 +1,25 @@
-import requests
-import time
 import csv
 import re
 import os 
-import subprocess #用来执行powershell命令并把输出重定向
+import subprocess
+import threading
 from concurrent.futures import ThreadPoolExecutor #多线程池
+from method_index import MethodResolver, DiffPositionTracker
+from repository import Repository, CLONE_FULL, clone
+from diff_store import DiffStore
+from git_backend import close_backend, close_backends
+from http_client import HttpClient, get_client, set_client
+from rate_limit import get_rate_limiter
+from file_index import RepositoryFileIndex, get_file_index
 access_token = "your_access_token" 
+GITHUB_API_URL = "https://api.github.com"
+
+# 每个仓库一把锁，避免多个线程同时克隆同一个仓库
+repo_locks = {}
+repo_locks_guard = threading.Lock()
+
+# diff文件头中的test文件
+TEST_DIFF_PATTERN = re.compile(r'^diff --git.*Test.*$', re.IGNORECASE)
 
 def has_test_case(line):
     """
@@ -18,8 +32,7 @@ def has_test_case(line):
         bool: 如果该行表示一个测试文件，则返回True，否则返回False。
     """
     assert isinstance(line, str)
-    pattern = "^diff --git.*Test.*$"
-    return bool(re.match(pattern, line, re.IGNORECASE))  # 忽略大小写
+    return bool(TEST_DIFF_PATTERN.match(line))  # 忽略大小写
 
 #统计仓库中test文件数量
 #对这个函数的意义成疑问
@@ -27,41 +40,31 @@ def count_test_files(repo_path):
     """
     统计仓库中测试文件的数量。
 
+    使用file_index中缓存的仓库文件索引，同一个仓库只建立一次索引，HEAD变化后才重新建立。
+
     参数:
         repo_path (str): 仓库的路径。
 
     返回:
         bool: 如果仓库中包含测试文件，返回True，否则返回False。
     """
-    # 定义测试文件的标志，比如文件名中包含 'test'，或位于 'tests' 目录
-    test_keywords = ['test', 'tests']
-
-    test_file_count = 0
-
-    # 遍历目录和文件
-    for root, dirs, files in os.walk(repo_path):
-        for file in files:
-            # 检查文件名或路径中是否包含测试关键字
-            if any(keyword in file.lower() for keyword in test_keywords) or any(keyword in root.lower() for keyword in test_keywords):
-                test_file_count += 1
-    if test_file_count == 0:
-        return False
-    else:
-        return True
+    index = get_file_index(repo_path)
+    # 仓库路径本身包含测试关键字时，所有文件都算测试文件（与遍历目录时的判断一致）
+    if RepositoryFileIndex.is_test_path(repo_path):
+        return bool(index.paths)
+    return index.has_tests()
     
 #获取当前分支名
 def get_branches_containing_commit(repo_path, commit_hash):
+    repository = Repository(repo_path)
     # 检查仓库路径是否存在
-    if not os.path.exists(repo_path):
+    if not repository.exists():
         print(f"Error: {repo_path} does not exist")
         return []
-    else:
-        os.chdir(repo_path)
     
     # 执行 git branch --contains 命令
     try:
-        result = subprocess.run(['git', 'branch', '-a', '--contains', commit_hash],
-                                capture_output=True, text=True, check=True)
+        result = repository.git('branch', '-a', '--contains', commit_hash, text=True, check=True)
         branches = result.stdout.strip().split("\n")
         branches = [branch.strip().replace("* ", "") for branch in branches]  # 去掉当前分支的星号
         return branches
@@ -74,7 +77,35 @@ def get_branches_containing_commit(repo_path, commit_hash):
         else:
             print(f"Error running git branch: {e}")
         return []
-    
+
+def get_branches_containing_commits(repo_path, commit_hashes):
+    """
+    批量获取包含各个提交的分支，整个仓库只遍历一次提交历史。
+
+    参数:
+        repo_path (str): 仓库的路径。
+        commit_hashes (list): 该仓库中需要查询的提交哈希。
+
+    返回:
+        dict: 提交哈希 -> 分支名列表，与get_branches_containing_commit的结果相同。
+    """
+    repository = Repository(repo_path)
+    if not repository.exists():
+        print(f"Error: {repo_path} does not exist")
+        return {commit_hash: [] for commit_hash in commit_hashes}
+
+    try:
+        branches = repository.branches_containing(commit_hashes)
+    except subprocess.CalledProcessError as e:
+        print(f"Error running git branch: {e}")
+        return {commit_hash: [] for commit_hash in commit_hashes}
+
+    for commit_hash, commit_branches in branches.items():
+        if commit_branches is None:
+            print(f"该提交 {commit_hash} 所在的分支已经被移除")
+            branches[commit_hash] = []
+    return branches
+
 def extract_commit_hash(url):
     """
     从给定的URL中提取提交哈希值。
@@ -94,6 +125,71 @@ def extract_commit_hash(url):
         return None
 
 
+# 行的类别
+LINE_BLANK = 'blank'
+LINE_IMPORT = 'import'
+LINE_COMMENT = 'comment'
+LINE_CODE = 'code'
+
+# 空行、import、单行注释、*开头的注释、多行注释的起始和结束合并为一个正则，每行只匹配一次
+LINE_CLASS_PATTERN = re.compile(
+    r'(?P<blank>\s*$)'
+    r'|\s*(?:(?P<import>import\s)|(?P<comment>//|\*\s|/\*))'
+    r'|(?P<comment_end>.*\*/\s*$)'
+)
+LINE_CLASS_TABLE = {
+    'blank': LINE_BLANK,
+    'import': LINE_IMPORT,
+    'comment': LINE_COMMENT,
+    'comment_end': LINE_COMMENT,
+}
+
+# 多行注释的起始和结束（process_diff_output中的注释追踪）
+COMMENT_OPEN_PATTERN = re.compile(r'\s*/\*')
+COMMENT_CLOSE_PATTERN = re.compile(r'.*\*/\s*$')
+# 连续的多个空格
+MULTI_SPACE_PATTERN = re.compile(r' {2,}')
+# diff文件头中的文件名
+DIFF_FILENAME_PATTERN = re.compile(r'/([^/]*)$')
+
+def classify_line(line):
+    """
+    判断diff中一行的类别（空行/import/注释/代码）。
+
+    参数:
+        line (str): diff输出的一行内容，可以带有首位的+ -。
+
+    返回:
+        str: LINE_BLANK、LINE_IMPORT、LINE_COMMENT或LINE_CODE。
+    """
+    #去除首位的+ -
+    if line[:1] in ('+', '-'):
+        line = line[1:]
+    match = LINE_CLASS_PATTERN.match(line)
+    if match is None:
+        return LINE_CODE
+    return LINE_CLASS_TABLE[match.lastgroup]
+
+def classify_lines(lines):
+    """
+    批量判断一个修改块中各行的类别。
+
+    参数:
+        lines (iterable): diff输出的多行内容。
+
+    返回:
+        list: 与lines一一对应的类别列表。
+    """
+    match = LINE_CLASS_PATTERN.match
+    table = LINE_CLASS_TABLE
+    classes = []
+    for line in lines:
+        if line[:1] in ('+', '-'):
+            line = line[1:]
+        line_match = match(line)
+        classes.append(LINE_CODE if line_match is None else table[line_match.lastgroup])
+    return classes
+
 def is_meaningful_hunk(line):
     """
     判断给定的行是否是有意义的修改。
@@ -104,110 +200,90 @@ def is_meaningful_hunk(line):
     返回:
         bool: 如果行是有意义的修改，则返回True，否则返回False。
     """
-    #去除首位的+ -
-    if line.startswith('+') or line.startswith('-'):
-        line = line[1:] 
-    
-    # 检查是否为空行
-    if not line.strip():
-        return False
-    
-    # 检查是否为缩进或空格
-    if re.match(r'^\s+$', line):
-        return False
-    
-    # 检查是否为import语句
-    if re.match(r'^\s*import\s+', line):
-        return False
-    
-    # 检查是否为单行注释
-    if re.match(r'^\s*//.*$', line):
-        return False
-
-    # 检查是否是*开头的单行注释
-    if re.match(r'^\s*\*\s',line):
-        return False
-    # 多行注释的起始
-    if re.match(r'^\s*/\*.*', line) or re.match(r'^\s*/\*\*',line):
-        return False
-    
-    # 多行注释的结束
-    if re.match(r'.*\*/\s*$', line):
-        return False
-    
+    return classify_line(line) == LINE_CODE
+
+# 匹配@@行
+HUNK_HEADER_PATTERN = re.compile(r'@@.*?@@')
+# 匹配@@后的函数定义
+HUNK_FUNCTION_PATTERN = re.compile(r'@@.*?@@\s*(.+)\s*\(')
+# 捕获函数返回值，函数名，参数
+FUNCTION_PATTERN = re.compile(r'\b(?:public|private|protected|static|final|synchronized|abstract|native)?\s*(\w+(\[\])?)\s+(\w+)\s*\(.*?\)\s*\{')
+# str.splitlines() 使用的行边界
+LINE_BREAK_PATTERN = re.compile('\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+# 控制结构关键字列表
+CONTROL_KEYWORDS = {'if', 'else', 'for', 'while', 'switch', 'catch', 'finally', 'try'}
+
+def track_enclosing_function(current_function, line):
+    """
+    读入diff的下一行，更新"当前所在函数"的状态。
+
+    与从修改行向上查找函数名等价：向上查找命中的是离修改行最近的
+    函数定义行或@@行，顺序读取时只需让这样的行覆盖之前的状态即可。
 
-    return True
-def extract_modified_functions(diff_lines,index):
+    参数:
+        current_function (str): 读入该行之前的函数名，可能为None。
+        line (str): diff输出的一行内容（未删除空格的原始行）。
+
+    返回:
+        str: 读入该行之后的函数名。
     """
-        提取给定diff输出中的修改函数名称。
-
-        参数:
-            diff_lines (list): 包含diff输出的行列表。
-            index: 修改行的标号
-
-        返回:
-            str: 该修改块所在的函数名称。
-        """
-    function_name = None
-    # open_braces = 0 # 追踪大括号的层次
-
-    # 匹配@@行
-    general = re.compile(r'@@.*?@@')
-    # 匹配函数定义行的正则表达式
-    function_general = re.compile(r'@@.*?@@\s*(.+)\s*\(')
-    #捕获函数返回值，函数名，参数
-    # 改进的函数匹配正则表达式
-    function_pattern = re.compile(r'\b(?:public|private|protected|static|final|synchronized|abstract|native)?\s*(\w+(\[\])?)\s+(\w+)\s*\(.*?\)\s*\{')
-
-    # 控制结构关键字列表
-    control_keywords = {'if', 'else', 'for', 'while', 'switch', 'catch', 'finally', 'try'}
-
-    # 记录当前是否处于修改块中
-    in_modified_block = True
-    get_func = False #是否找到函数
-
-    # 向上查找函数名
-    for j in range(index-1, -1, -1):
-        prev_line = diff_lines[j] #上一行
-
-        match_general = general.search(prev_line)  #匹配@@行
-        function_match_general = function_general.search(prev_line) # 匹配@@后的函数
-        function_match = function_pattern.search(prev_line) # 匹配函数定义行
-
-        # 找到了最近的函数名
-        if function_match:
-            get_func = True
-            function_name = function_match.group(3).strip()
-            if function_name not in control_keywords:
-                #print(prev_line)
-                break  # 找到函数名，停止向上查找
-            else:
-                get_func = False
-                function_name = None
-                continue  # 跳过控制结构关键字
-
-        # 如果一直找到@@还没找到函数，则在@@后的函数里  （疑问，新增的函数算否）
-        if match_general and get_func==False:
-            #print(prev_line+"@@@@@@@@@")
-            in_modified_block = False # 遇到@@说明hunk块一定结束了
-            if function_match_general:
-                #print("@@@@@@"+prev_line)
-                get_func = True
-                function_name = function_match_general.group(1).strip()
-            # print("############"+function_name)
-            else:
-                function_name = None
-            break  # 找到函数名，停止向上查找
+    function_match = FUNCTION_PATTERN.search(line)
+    if function_match:
+        function_name = function_match.group(3).strip()
+        if function_name in CONTROL_KEYWORDS:
+            return current_function  # 向上查找时跳过控制结构行
+        return function_name
+
+    if HUNK_HEADER_PATTERN.search(line):
+        function_match_general = HUNK_FUNCTION_PATTERN.search(line)
+        return function_match_general.group(1).strip() if function_match_general else None
 
-        #如果一个@@结束还没有找到函数
-        if in_modified_block == False and get_func == False:
-            break
+    return current_function
 
-    return function_name
+def iter_diff_lines(diff_output):
+    """
+    逐行产出diff内容（不含换行符），按需切分，不一次生成整个行列表。
+
+    分行规则与 str.splitlines() 相同（除\n、\r\n、\r外，\x0b、\x0c、\x1c-\x1e、\x85、\u2028、\u2029也是行边界），
+    与原来的 diff_output.splitlines() 得到相同的行。
+
+    参数:
+        diff_output (str | file): diff字符串，或已打开的diff文件。
 
-def process_diff_output(repo,diff_output):
+    返回:
+        generator: 依次产出每一行。
+    """
+    chunks = [diff_output] if isinstance(diff_output, str) else diff_output
+    for chunk in chunks:
+        start = 0
+        for match in LINE_BREAK_PATTERN.finditer(chunk):
+            yield chunk[start:match.start()]
+            start = match.end()
+        if start < len(chunk):
+            yield chunk[start:]
+
+def process_diff_output(repo,diff_output,method_resolver=None):
     # 处理每个diff并计算相关变量
-    lines = diff_output.splitlines(keepends=False)
+    return analyze_diff_lines(repo, iter_diff_lines(diff_output), method_resolver)
+
+def analyze_diff_lines(repo, diff_lines, method_resolver=None):
+    """
+    从头到尾只读一遍diff，统计file/java_file_count/func/hunk/function_name。
+
+    修改块所在函数由track_enclosing_function顺序维护，不再对每个hunk向上回溯，
+    耗时与diff行数成线性关系，diff_lines可以是生成器。
+
+    传入method_resolver（method_index.MethodResolver）时，改为根据@@中的行号
+    在修改前后的Java文件中查找修改行所在的方法。
+
+    参数:
+        repo (str): 仓库名。
+        diff_lines (iterable): diff输出的各行（不含换行符）。
+        method_resolver (MethodResolver): 可选，用tree-sitter定位函数。
+
+    返回:
+        dict: 统计结果。
+    """
     is_new_diff =False#是否是新的diff
     file_count = 0 # 文件数（非test）
     java_file_count = 0 #java文件数
@@ -218,15 +294,20 @@ def process_diff_output(repo,diff_output):
     in_multiline_comment = False # 用于标记是否处于多行注释中
     funcset = [] # 去重
     have_test = 0 # 用于标记仓库内是否有test文件
-    for i,line in enumerate(lines):
-        #print(i)
-        line = re.sub(r' {2,}', '', line)  # 删除多余空格
+    current_function = None # 当前行之前最近的函数名
+    position_tracker = DiffPositionTracker() if method_resolver is not None else None
+    for raw_line in diff_lines:
+        enclosing_function = current_function
+        current_function = track_enclosing_function(current_function, raw_line)
+        if position_tracker is not None:
+            position = position_tracker.feed(raw_line) # 修改行在文件中的位置
+        line = MULTI_SPACE_PATTERN.sub('', raw_line) if '  ' in raw_line else raw_line  # 删除多余空格
 
         # 检查是否是diff文件头
         if line.startswith("diff"):
             # is_change = False
             is_test_case = False
-            match = re.search(r'/([^/]*)$', line)
+            match = DIFF_FILENAME_PATTERN.search(line)
             filename = match.group(1) if match else "" #获得修改文件的文件名
         
         # 检测是否是test文件
@@ -261,9 +342,9 @@ def process_diff_output(repo,diff_output):
                 or (line.startswith("-") == True and line.startswith("---") == False)) and (is_change == 0):
 
                 # 判断是否在多行注释中
-                if (re.match(r'^\s*/\*.*', line) or re.match(r'^\s*/\*\*',line)) and not in_multiline_comment:
+                if COMMENT_OPEN_PATTERN.match(line) and not in_multiline_comment:
                     in_multiline_comment = True
-                elif re.match(r'.*\*/\s*$', line) and in_multiline_comment:
+                elif COMMENT_CLOSE_PATTERN.match(line) and in_multiline_comment:
                     in_multiline_comment = False
                 
                 # 如果当前修改行在多行注释中，则跳过
@@ -272,7 +353,10 @@ def process_diff_output(repo,diff_output):
 
                 if is_meaningful_hunk(line):
                     # 找到一个有效hunk则寻找其所在func
-                    func_name = extract_modified_functions(lines,i)
+                    if method_resolver is not None and position is not None:
+                        func_name = method_resolver.resolve(*position, default=enclosing_function)
+                    else:
+                        func_name = enclosing_function
                     funcset.append(func_name)
                     is_change = 1
                     hunk_count = hunk_count + 1
@@ -306,19 +390,21 @@ def process_diff_output(repo,diff_output):
 
     return datas
 
-def clone_repository(url, output_dir):
+def clone_repository(url, output_dir, clone_mode=CLONE_FULL, http_client=None):
+    http_client = http_client or get_client()
     try:
         # 从URL中提取仓库名
         repository_name = re.search(r'/([^/]+/[^/]+)/commit/', url).group(1)
         repo = re.search(r'[^/]+$', repository_name).group()
         # 构造仓库地址
         repository_url = f"https://{access_token}@github.com/{repository_name}"
-        api_url = f"https://api.github.com/repos/{repository_name}"
+        api_url = f"{GITHUB_API_URL}/repos/{repository_name}"
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Accept": "application/vnd.github.v3+json"
         }
-        response = requests.get(api_url, headers=headers)
+        # 同一个仓库在一次运行中只请求一次，之后的运行用条件请求确认
+        response = http_client.get(api_url, headers=headers)
 
         if response.status_code == 200:
             # url有效
@@ -326,12 +412,11 @@ def clone_repository(url, output_dir):
             if os.path.exists(os.path.join(output_dir, repo)):
                 #print(f"Repository {repo} already exists, skipping...")
                 return
-            # 在指定目录下执行git clone命令
-            subprocess.run(["git", "clone", repository_url])
+            # 在指定目录下执行git clone命令，只有被GitHub限流时才等待
+            get_rate_limiter().acquire(cost=0)
+            clone(repository_url, os.path.join(output_dir, repo), clone_mode)
             print(f"Successfully cloned {url}")
             print(repository_name)
-            # 延迟一段时间，避免频繁请求
-            time.sleep(2)  # 可根据需要调整延迟时间
             return True
         else:
         #response.status_code == 404:
@@ -340,23 +425,143 @@ def clone_repository(url, output_dir):
     except Exception as e:
         print(f"Error cloning {url}: {e}")
         
-def main():
+def get_repo_lock(repo):
+    """
+    获取某个仓库的锁，保证同一个仓库不会被多个线程同时克隆。
+    """
+    with repo_locks_guard:
+        if repo not in repo_locks:
+            repo_locks[repo] = threading.Lock()
+        return repo_locks[repo]
+
+def process_commit(index, url, base_path1, cwe_key_word, matched_key_word, grammar_path, use_tree_sitter, commits_by_repo, diff_store, clone_mode):
+    """
+    处理一条url：克隆检查、获取分支、git diff、统计。可以在线程池中并发执行。
+
+    参数:
+        index (int): 该url在输入文件中的序号。
+        url (str): commit的url。
+        base_path1 (str): 存放所有仓库的目录。
+        cwe_key_word, matched_key_word: 写入结果的关键字。
+        grammar_path (str): tree-sitter Java 语法文件的路径。
+        use_tree_sitter (bool): 是否用tree-sitter定位修改块所在的函数。
+        commits_by_repo (dict): repo -> 输入文件中该仓库的所有提交，用于批量获取分支。
+        diff_store (DiffStore): 按提交保存的diff，已有的diff不再重新生成。
+        clone_mode (str): 克隆方式，见repository.clone。
+
+    返回:
+        tuple: (结果行, repo, diff_output)，url无法解析时repo和diff_output为None；
+        url对应的仓库已经被删除时返回None。
+    """
+    # 获取diff内容diff_output
+    match = re.search(r'/([^/]+/[^/]+)/commit/', url)
+
+    if not match:
+        result = {
+        'index': index,
+        'cwe key word': cwe_key_word,
+        'matched key word': matched_key_word,
+        'file': '0',
+        'func': '0',
+        'hunk': '0',
+        'function_name': '',
+        'note': "",  # 人工标注
+        'repo': '',
+        'branch': '',
+        'url': url,
+        'testcase': ''  
+        }
+        return result, None, None
+
+    repository_name = match.group(1)
+    # note = get_commit_subject(commit_hash,repo) #获取commit的subject
+
+    commit_hash = extract_commit_hash(url)
+    repo = re.search(r'[^/]+$', repository_name).group() #获取repo
+    repo_path = os.path.join(base_path1, repo) #获取仓库的本地克隆目录
+    with get_repo_lock(repo):
+        if clone_repository(url, base_path1, clone_mode) == False:
+            return None #对应的url链接已经被删除不输出，共20条
+        # 同一仓库的所有提交一起查询，结果会被缓存，其他线程直接复用
+        branch = get_branches_containing_commits(repo_path, commits_by_repo.get(repo, [])).get(commit_hash, []) #获取分支名
+    repository = Repository(repo_path)
+
+    # 先从diff_store中读取，之前的运行已经生成过的diff不再重新生成
+    diff_output = diff_store.get(repo, commit_hash)
+    if diff_output is None:
+        # 通过常驻的 git diff-tree 进程生成，等价于 git diff {commit_hash}^..{commit_hash}
+        diff_output = repository.backend().diff(commit_hash) if repository.exists() else ''
+        #如果git diff命令的输出为空，从网络获取
+        if diff_output is None or len(diff_output) < 1:
+            print("the repo"+repo+" local is bad")
+            diff_url = url + '.diff'
+            response = get_client().get(diff_url)
+            # 只使用成功的响应，404/429/5xx的错误页面不能当作diff保存
+            if response.status_code == 200:
+                print("it is solved")
+                diff_output = response.text
+            else:
+                print(f"获取 {diff_url} 失败，状态码 {response.status_code}")
+                diff_output = ''
+        # 没有得到diff时不保存，下次运行重新获取
+        if diff_output:
+            diff_store.put(repo, commit_hash, diff_output)
+
+    # 获取结果
+    method_resolver = MethodResolver(repo_path, commit_hash, grammar_path) if use_tree_sitter else None
+    datas = process_diff_output(repo, diff_output, method_resolver)
+    result = {
+        'index': index,
+        'cwe key word': cwe_key_word,
+        'matched key word': matched_key_word,
+        'file': f"{datas['file']}({datas['java_file_count']})",
+        'func': datas['func'],
+        'hunk': datas['hunk'],
+        'function_name': datas['function_name'],
+        'note': "",  # 人工标注
+        'repo': repo,
+        'branch': branch,
+        'url': url,
+        'testcase': int(datas['is_test_case'])  
+    }
+    return result, repo, diff_output
+
+def main(max_workers=5):
+    """
+    并发处理输入文件中的所有url，按输入顺序写入结果。
+
+    参数:
+        max_workers (int): 线程池大小，各阶段主要在等待git和网络，可以明显大于CPU核数。
+    """
     base_path1='E:\\dachaung\\github_clone' #存放所有仓库的地方，一般是硬盘的目录
     output_file = "E:\\dachaung\\output.csv"#输出文件
     input_csv = "E:\\dachaung\\veracode_fliter.csv"#输入文件k
+    grammar_path = 'build/my-languages.so' # tree-sitter Java 语法文件的路径
+    use_tree_sitter = False # 是否用tree-sitter定位修改块所在的函数
+    diff_store = DiffStore(os.path.join(base_path1, '.diffs')) # 按 <repo>/<commit_hash> 保存的diff
+    clone_mode = CLONE_FULL # 克隆方式，大仓库可以用CLONE_BLOBLESS或CLONE_SPARSE
+    set_client(HttpClient(cache_dir=os.path.join(base_path1, '.http_cache'), pool_size=max_workers,
+                          rate_limiter=get_rate_limiter())) # GitHub API和.diff的响应缓存，按剩余额度限速
     # 表头
     header = ['index', 'cwe key word', 'matched key word', 'file', 'func', 'hunk', 'function_name', 'note', 'repo', 'branch', 'url','testcase']
     urls = []
     # 获取csv文件里的urls
-    max_workers=5
     with open(input_csv) as csvfile:
         reader = csv.reader(csvfile)
         urls = [row[3] for row in reader]
-    # 克隆仓库
-    #  os.chdir(base_path1)
-    # with ThreadPoolExecutor(max_workers=max_workers) as executor:
-    #     for url in urls:
-    #         executor.submit(clone_repository,url,base_path1)
+
+    # 每个仓库的所有提交
+    commits_by_repo = {}
+    # 仓库 -> 该仓库最后一条url的序号，处理完后关闭该仓库的常驻git进程
+    last_index_by_repo = {}
+    for index, url in enumerate(urls, start=1):
+        match = re.search(r'/([^/]+/[^/]+)/commit/', url)
+        if match:
+            repo = re.search(r'[^/]+$', match.group(1)).group()
+            last_index_by_repo[repo] = index
+            commit_hash = extract_commit_hash(url)
+            if commit_hash:
+                commits_by_repo.setdefault(repo, []).append(commit_hash)
 
     # CSV 文件写入
     with open(output_file, mode='w', newline='', encoding='utf-8') as f:
@@ -366,77 +571,33 @@ def main():
         ###########手动筛选################
         cwe_key_word = {'CWE-79': ['XSS', 'Cross Site Scripting']}
         matched_key_word = {'CWE-79': ['XSS']}
-        
-        for index, url in enumerate(urls, start=1):
-            # 获取diff内容diff_output
-            match = re.search(r'/([^/]+/[^/]+)/commit/', url)
-    
-            if not match:
-                
-                result = {
-                'index': index,
-                'cwe key word': cwe_key_word,
-                'matched key word': matched_key_word,
-                'file': '0',
-                'func': '0',
-                'hunk': '0',
-                'function_name': '',
-                'note': "",  # 人工标注
-                'repo': '',
-                'branch': '',
-                'url': url,
-                'testcase': ''  
-                }
-                writer.writerow(result)
-                continue
-            
-            repository_name = match.group(1)
-            # note = get_commit_subject(commit_hash,repo) #获取commit的subject
-        
-                
-            commit_hash = extract_commit_hash(url)
-            os.chdir(base_path1)
-            if clone_repository(url, base_path1) == False:
-                continue#对应的url链接已经被删除不输出，共20条
-            repo = re.search(r'[^/]+$', repository_name).group() #获取repo
-            repo_path = os.path.join(base_path1, repo) #获取仓库的本地克隆目录
-            branch = get_branches_containing_commit(repo_path, commit_hash) #获取分支名
-            
-            # os.chdir(os.path.join(base_path1, repo)) #改变当前工作目录到仓库的本地克隆目录
-            diff_command = f'git diff {commit_hash}^..{commit_hash}'  # 注意添加了空格
-            diff_output = subprocess.run(['powershell', '-Command', diff_command], capture_output=True, text=True, encoding='utf-8',errors='ignore' ).stdout
-                #如果git diff命令的输出为空，从网络获取
-            
-            if diff_output is None or len(diff_output) < 1:
-                print("the repo"+repo+" local is bad")
-                diff_url = url + '.diff'
-                res = requests.get(diff_url).text
-                if res != None:
-                    print("it is solved")
-                    diff_output = res
-            
-            #print(diff_output) #调试一下
-            
-            with open(os.path.join(base_path1, repo, 'diff.txt'), 'w', encoding='utf-8') as file:
-                file.write(diff_output)
-            
-            # 获取结果并写入CSV
-            datas = process_diff_output(repo, diff_output)
-            result = {
-                'index': index,
-                'cwe key word': cwe_key_word,
-                'matched key word': matched_key_word,
-                'file': f"{datas['file']}({datas['java_file_count']})",
-                'func': datas['func'],
-                'hunk': datas['hunk'],
-                'function_name': datas['function_name'],
-                'note': "",  # 人工标注
-                'repo': repo,
-                'branch': branch,
-                'url': url,
-                'testcase': int(datas['is_test_case'])  
-            }
-            writer.writerow(result)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 重复的url只处理一次，共用同一个结果
+            futures_by_url = {}
+            futures = []
+            for index, url in enumerate(urls, start=1):
+                if url not in futures_by_url:
+                    futures_by_url[url] = executor.submit(process_commit, index, url, base_path1, cwe_key_word, matched_key_word,
+                                                          grammar_path, use_tree_sitter, commits_by_repo, diff_store, clone_mode)
+                futures.append((index, futures_by_url[url]))
+
+            # 按index顺序写入，diff.txt也按顺序写入，同一仓库保留最后一个commit的diff
+            # 按顺序读取结果时，该仓库序号更小的url都已经处理完
+            last_repo_by_index = {index: repo for repo, index in last_index_by_repo.items()}
+            for index, future in futures:
+                processed = future.result()
+                if index in last_repo_by_index:
+                    close_backend(os.path.join(base_path1, last_repo_by_index[index]))
+                if processed is None:
+                    continue
+                result, repo, diff_output = processed
+                if repo is not None:
+                    with open(os.path.join(base_path1, repo, 'diff.txt'), 'w', encoding='utf-8') as file:
+                        file.write(diff_output)
+                writer.writerow(dict(result, index=index))
+
+    close_backends()
 
 
     print(f"Data has been written to {output_file}")
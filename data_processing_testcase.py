@@ -1,8 +1,5 @@
-import subprocess
-import json
 from pathlib import Path
 import tree_sitter
-from tree_sitter import Language, Parser
 import warnings
 import os
 import csv
@@ -13,100 +10,84 @@ import time
 from tempfile import TemporaryDirectory
 access_token = "your_token" 
 import shutil
+from diff_store import DiffStore
+from repository import Repository
+from git_backend import close_backend
+from diff_parser import PathIndex, parse_diff, read_file_changes
+from signature_index import SignatureIndex
+from data_processing import extract_commit_hash
+from find_map_test_cases import focal_method_signatures, get_test_parser
 # 忽略 FutureWarning
 warnings.simplefilter('ignore', FutureWarning)
 
 
 
-def get_modified_java_files(diff_file_path):
-    """从指定的diff文件中获取所有Java文件的文件名列表，不包含文件夹路径。"""
-    modified_java_files = []
-
-    # 检查文件是否存在
-    if os.path.exists(diff_file_path):
-        # 打开并读取文件内容
-        with open(diff_file_path, 'r') as file:
-            for line in file:
-                if line.startswith('diff --git'):
-                    # 获取文件的完整路径
-                    full_path = line.strip()
-                    # 检查是否以.java结尾且不为空
-                    if full_path.endswith('.java') and full_path:
-                        # 使用os.path.basename获取文件名
-                        filename = os.path.basename(full_path)
-                        modified_java_files.append(filename)
+def get_modified_java_files(diff_file_path, changes=None):
+    """
+    从指定的diff文件中获取所有Java文件的文件名列表，不包含文件夹路径。
 
-    return modified_java_files
+    参数:
+        diff_file_path (str): diff文件路径。
+        changes (list): 已经解析好的FileChange列表，不为空时不再读取diff文件。
+    """
+    if changes is None:
+        changes = read_file_changes(diff_file_path)
+    return [os.path.basename(change.path) for change in changes if change.path and change.path.endswith('.java')]
 
 
 
-def get_modified_java_path(repo_path):
+def get_modified_java_path(repo_path, diff_file_path=None, changes=None):
     """
     从指定的仓库路径中获取所有修改过的Java文件的文件路径列表。
     参数:
         repo_path (str): 仓库路径。
+        diff_file_path (str): diff文件路径，默认为仓库下的diff.txt。
+        changes (list): 已经解析好的FileChange列表，不为空时不再读取diff文件。
     返回:
         list: 包含所有修改过的Java文件的文件路径列表。
     """
-    path = repo_path + '/diff.txt'
-    with open(path, 'r', encoding='utf-8') as file:
-        diff_output = file.read()
-        get_modifed_java_path = extract_java_file_paths(diff_output)
-        return get_modifed_java_path
+    if changes is None:
+        path = diff_file_path if diff_file_path else repo_path + '/diff.txt'
+        with open(path, 'r', encoding='utf-8') as file:
+            changes = list(parse_diff(file))
+    return java_file_paths(changes)
 
 
 
-def run_find_map_test_cases(repo_path, repo_name, grammar_path, output_dir):
+def run_find_map_test_cases(repo_path, repo_name, grammar_path, output_dir, processes=1):
     """
-    使用 Git Bash 运行 find_map_test_cases.py 脚本。
+    在当前进程中运行 find_map_test_cases，获得仓库中有测试用例的焦点方法签名。
+
+    tree-sitter解析器在整个进程中只加载一次，所有仓库共用；
+    结果直接返回，同时仍在输出文件夹中写出log.txt和<repo>_signature.json。
+    每个文件的解析结果按blob哈希缓存在 <output_dir>/.mapping_cache 中，重新运行时只解析内容变化的文件。
 
     参数:
         repo_path (str): 仓库路径。
         repo_name (str): 仓库名称。
         grammar_path (str): tree-sitter Java 语法文件的路径。
         output_dir (str): 输出文件夹的路径。
+        processes (int): 解析测试类和焦点类的进程数，大于1时使用进程池并行解析。
 
     返回:
-        dict: 包含所有方法签名的列表。
+        list: 包含所有方法签名的列表。
     """
-    repo_full_path = os.path.join(output_dir, repo_name)
-    json_name = repo_name + '_signature.json'
-    json_file_path = os.path.join(repo_full_path,json_name)
-    #  如果在tmp/output目录下已经存在repo则不再执行
-    # if(os.path.exists(repo_full_path)):
-
-    #     if(os.path.exists(json_file_path)):
-    #         with open(json_file_path, 'r') as file:
-    #             mapping = json.load(file)
-    #             return mapping
-    #     else:
-    #         return []
-
-    # Git Bash 的路径
-    git_bash_path = r"E:/Git/git-bash.exe"
-    
-    # 要运行的脚本命令
-    command = [
-        git_bash_path,
-        '-c',  # 使用 -c 参数来执行命令
-        f"python e:/dachuang/find_map_test_cases.py "  # 使用正斜杠
-        f"--repo_path {repo_path} "
-        f"--repo_name {repo_name} "
-        f"--grammar {grammar_path} "
-        f"--output {output_dir}"
-    ]
-    
-    # print(f"Running command: {command}")
-    # 执行命令并捕获输出
+    cache_dir = os.path.join(output_dir, '.mapping_cache')
+    return focal_method_signatures(repo_path, repo_name, grammar_path, output_dir, cache_dir=cache_dir,
+                                   processes=processes)
 
-    subprocess.run(command, capture_output=True, text=True)
-    
-    if(os.path.exists(json_file_path)):
-        with open(json_file_path, 'r') as file:
-            mapping = json.load(file)
-            return mapping
-    else:
-        return []
+
+
+def java_file_paths(changes):
+    """
+    返回FileChange列表中所有Java文件修改前后的路径（去重，保持diff中的顺序）。
+    """
+    paths = {}
+    for change in changes:
+        for path in change.paths:
+            if path.endswith('.java'):
+                paths.setdefault(path, None)
+    return list(paths)
 
 
 
@@ -114,51 +95,29 @@ def extract_java_file_paths(diff_output):
     """
     从diff输出中提取所有修改过的Java文件的文件路径。
 
+    只取文件头（diff --git、---/+++、rename from/to）中的路径，代码行中形如 a/xxx.java 的字符串不会被提取。
+
     参数:
         diff_output (str): 包含diff输出的字符串。
 
     返回:
         list: 包含所有修改过的Java文件的文件路径列表。    
     """
-    pattern = r'(?:a/|b/)([^ \t\n\r\f\v]+)'
-    matches = re.findall(pattern, diff_output)
-
-    java_file_paths = [path for path in matches if path.endswith('.java')]
-
-    unique_java_file_paths = list(set(java_file_paths))
-
-    return unique_java_file_paths
+    return java_file_paths(parse_diff(diff_output.splitlines()))
 
 
 
-def  extract_method_signatures(file_path):
+class JavaToolkit():
     """
-    解析 Java 文件并提取所有方法签名
+    进程内共用的Java解析工具：语法库、解析器（带解析缓存的TestParser）和编译好的查询只加载一次，
+    每个文件只需要解析和匹配。
 
-    :param file_path: Java 文件路径
-    :return: 包含所有方法签名的列表
+    参数:
+        grammar_path (str): tree-sitter Java 语法文件的路径。
     """
-    # 加载 Java 语法库
-    JAVA_LANGUAGE = Language('build/my-languages.so', 'java')
-    parser = Parser()
-    parser.set_language(JAVA_LANGUAGE)
-    # 读取要解析的 Java 文件
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            java_code = file.read()
-    except FileNotFoundError:
-        print(f"文件 {file_path} 不存在")
-        return []
-
-    # 使用 Tree-sitter 解析代码
-    tree = parser.parse(bytes(java_code, "utf-8"))
-
-    # 输出语法树结构以便调试
-    # print("语法树结构：")
-    # print(tree.root_node.sexp())
 
     # Tree-sitter 查询语法，用于提取所有方法声明
-    method_query = """
+    METHOD_QUERY = """
     (method_declaration 
       (modifiers)?
       type: (_) @return_type
@@ -166,65 +125,138 @@ def  extract_method_signatures(file_path):
       parameters: (formal_parameters) @param_list
     )
     """
-    # 创建 Query 对象并执行查询
-    query = JAVA_LANGUAGE.query(method_query)
-    captures = query.captures(tree.root_node)
-
-    # 用于存储方法签名的列表
-    method_signatures = []
-    current_method = {"params": [], "method_name": None, "return_type": None}
-
-    for capture in captures:
-        node, capture_name = capture
-        if capture_name == 'return_type':
-            if current_method['method_name'] is not None:
-                # 生成方法签名并添加到列表
-                params_str = ", ".join(current_method['params'])
-                signature = f"{current_method['return_type']} {current_method['method_name']}({params_str})"
-                method_signatures.append(signature)
-                current_method = {"params": [], "method_name": None, "return_type": None}
-            current_method['return_type'] = node.text.decode('utf-8')
-
-        elif capture_name == 'method_name':
-            current_method['method_name'] = node.text.decode('utf-8')
-
-        elif capture_name == 'param_list':
-            # 遍历参数列表节点，提取每一个参数
-            param_list_node = node
-            for i in range(param_list_node.named_child_count):
-                param_node = param_list_node.named_child(i)
-                param_type_node = param_node.child_by_field_name('type')
-                param_name_node = param_node.child_by_field_name('name')
-                if param_type_node is None or param_name_node is None:
-                    continue
 
-                param_type = param_type_node.text.decode('utf-8')
-                param_name = param_name_node.text.decode('utf-8')
-                current_method['params'].append(f"{param_type} {param_name}")
+    def __init__(self, grammar_path='build/my-languages.so'):
+        self.parser = get_test_parser(grammar_path)
+        self.language = self.parser.language
+        self.method_query = self.language.query(self.METHOD_QUERY)
+
+    @staticmethod
+    def parameter_declaration(param_node):
+        """
+        返回一个参数的声明 "类型 参数名[维度]"，与 export_mtc 写出的参数列表经 canonical_signature 转换后一致。
+
+        - formal_parameter：保留参数名后的维度，例如 int xs[]
+        - spread_parameter（可变参数）：类型和参数名没有字段名，输出 String... names
+        - 其他（例如注释）返回None
+        """
+        if param_node.type == 'formal_parameter':
+            type_node = param_node.child_by_field_name('type')
+            name_node = param_node.child_by_field_name('name')
+            dimensions_node = param_node.child_by_field_name('dimensions')
+            suffix = ''
+        elif param_node.type == 'spread_parameter':
+            type_node = name_node = dimensions_node = None
+            for child in param_node.named_children:
+                if child.type == 'variable_declarator':
+                    name_node = child.child_by_field_name('name')
+                    dimensions_node = child.child_by_field_name('dimensions')
+                elif child.type != 'modifiers' and type_node is None:
+                    type_node = child
+            suffix = '...'
+        else:
+            return None
+        if type_node is None or name_node is None:
+            return None
+
+        dimensions = dimensions_node.text.decode('utf-8') if dimensions_node is not None else ''
+        return f"{type_node.text.decode('utf-8')}{suffix} {name_node.text.decode('utf-8')}{dimensions}"
+
+
+    def method_signatures(self, tree):
+        """
+        提取语法树中所有方法的签名。
+        """
+        captures = self.method_query.captures(tree.root_node)
+
+        # 用于存储方法签名的列表
+        method_signatures = []
+        current_method = {"params": [], "method_name": None, "return_type": None}
+
+        for capture in captures:
+            node, capture_name = capture
+            if capture_name == 'return_type':
+                if current_method['method_name'] is not None:
+                    # 生成方法签名并添加到列表
+                    params_str = ", ".join(current_method['params'])
+                    signature = f"{current_method['return_type']} {current_method['method_name']}({params_str})"
+                    method_signatures.append(signature)
+                    current_method = {"params": [], "method_name": None, "return_type": None}
+                current_method['return_type'] = node.text.decode('utf-8')
+
+            elif capture_name == 'method_name':
+                current_method['method_name'] = node.text.decode('utf-8')
+
+            elif capture_name == 'param_list':
+                # 遍历参数列表节点，提取每一个参数
+                param_list_node = node
+                for i in range(param_list_node.named_child_count):
+                    param = self.parameter_declaration(param_list_node.named_child(i))
+                    if param is not None:
+                        current_method['params'].append(param)
+
+        # 捕获最后一个方法的签名
+        if current_method['method_name'] is not None:
+            params_str = ", ".join(current_method['params'])
+            signature = f"{current_method['return_type']} {current_method['method_name']}({params_str})"
+            method_signatures.append(signature)
+
+        return method_signatures
+
+
+# 每个语法文件一个JavaToolkit
+_toolkits = {}
+
+
+def get_java_toolkit(grammar_path='build/my-languages.so'):
+    """
+    返回语法文件对应的JavaToolkit，同一个语法文件在进程中只加载一次。
+    """
+    if grammar_path not in _toolkits:
+        _toolkits[grammar_path] = JavaToolkit(grammar_path)
+    return _toolkits[grammar_path]
+
+
 
-    # 捕获最后一个方法的签名
-    if current_method['method_name'] is not None:
-        params_str = ", ".join(current_method['params'])
-        signature = f"{current_method['return_type']} {current_method['method_name']}({params_str})"
-        method_signatures.append(signature)
+def  extract_method_signatures(file_path, toolkit=None):
+    """
+    解析 Java 文件并提取所有方法签名
+    语法树和提取结果保存在共用的解析缓存中，与 find_map_test_cases 共用，文件没有变化时不再重新解析
+
+    :param file_path: Java 文件路径
+    :param toolkit: 使用的JavaToolkit，默认为 build/my-languages.so 对应的共用实例
+    :return: 包含所有方法签名的列表
+    """
+    if toolkit is None:
+        toolkit = get_java_toolkit()
 
-    return method_signatures
+    # 读取并解析要处理的 Java 文件（优先使用缓存）
+    try:
+        parsed_file = toolkit.parser.parse_tree(file_path, encoding='utf-8')
+    except FileNotFoundError:
+        print(f"文件 {file_path} 不存在")
+        return []
+    if 'method_signatures' not in parsed_file.derived:
+        parsed_file.derived['method_signatures'] = toolkit.method_signatures(parsed_file.tree)
+    return list(parsed_file.derived['method_signatures'])
 
 
 
 def method_exists(mapping, method_signature):
     """
-    检查给定的方法签名是否存在于映射列表中。
+    检查给定的方法签名是否存在于映射中。
 
     参数：
-        mapping: 包含方法签名的列表
+        mapping: SignatureIndex（每个仓库建立一次），或包含方法签名的列表
         method_signature: 方法签名
 
     返回值: 如果方法存在则返回 True，否则返回 False
     """ 
-    if(mapping == []) :
+    if not mapping:
         return False
-    # 直接检查给定的方法签名是否在列表中
+    if not isinstance(mapping, SignatureIndex):
+        mapping = SignatureIndex(mapping)
+    # 按 (返回类型, 方法名, 参数类型) 比较，与空白、换行和参数名无关
     return method_signature in mapping
 
 
@@ -247,6 +279,7 @@ def main():
     input_csv = "E:/dachuang/output.csv"  # 输入文件
     output_dir = 'E:/dachuang/tmp/output/'  # 输出文件夹的路径
     grammar_path = 'E:/dachuang/build/my-languages.so'  # tree-sitter Java 语法文件的路径
+    diff_store = DiffStore(os.path.join(base_path1, '.diffs'))  # data_processing.py按提交保存的diff
 
     urls = []
     # 获取 CSV 文件里的 URLs
@@ -256,10 +289,8 @@ def main():
         urls = [row[10] for row in reader]
 
 
-    # 加载 Java 语法库
-    JAVA_LANGUAGE = Language('build/my-languages.so', 'java')
-    parser = Parser()
-    parser.set_language(JAVA_LANGUAGE)
+    # 加载 Java 语法库和查询（整个进程只加载一次）
+    toolkit = get_java_toolkit(grammar_path)
     
     # os.chdir(base_path1)
     header = ['index', 'cwe key word', 'matched key word', 'file', 'func', 'hunk', 'function_name', 'note', 'repo', 'branch', 'url', 'testcase']
@@ -274,7 +305,7 @@ def main():
     testcase_results = {}
 
     for url in urls:
-        # commit_hash = extract_commit_hash(url)
+        commit_hash = extract_commit_hash(url)
         
         match = re.search(r'/([^/]+/[^/]+)/commit/', url)
         if not match:
@@ -283,15 +314,36 @@ def main():
         repo = re.search(r'[^/]+$', repository_name).group()  # 获取 repo
         print("处理仓库:", repo)
 
-        # 修改文件列表（仅java文件）
+        # 只使用该提交自己的diff，diff_store中没有时用git生成并保存；
+        # 仓库下的diff.txt是最后写入的那个提交的diff，不能用于其他提交
         repo_path = base_path1 + '/' + repo
-        modified_java_files = get_modified_java_files(repo_path + '/diff.txt')
+        diff_file_path = diff_store.path(repo, commit_hash)
+        if diff_file_path is None:
+            print(f"无法从url中得到提交哈希，跳过: {url}")
+            continue
+        if not os.path.exists(diff_file_path):
+            repository = Repository(repo_path)
+            diff_output = repository.backend().diff(commit_hash) if repository.exists() else ''
+            close_backend(repo_path)
+            if not diff_output:
+                print(f"没有提交 {commit_hash} 的diff，跳过: {url}")
+                continue
+            diff_store.put(repo, commit_hash, diff_output)
+
+        # diff只读取、解析一次，文件名列表和路径列表都从中得到
+        changes = read_file_changes(diff_file_path)
+
+        # 修改文件列表（仅java文件）
+        modified_java_files = get_modified_java_files(diff_file_path, changes)
         
         # 修改文件路径列表（仅java文件）
-        modified_java_path = get_modified_java_path(base_path1 + '/' + repo)#已测试有效
+        modified_java_path = get_modified_java_path(repo_path, diff_file_path, changes)
+        # 文件名 -> 路径的索引，不同包中的同名文件都能找到
+        path_index = PathIndex(modified_java_path)
         
         # 获得 mapping 列表
-        mapping = run_find_map_test_cases(repo_path, repo, grammar_path, output_dir)
+        mapping = run_find_map_test_cases(repo_path, repo, grammar_path, output_dir, processes=max_workers)
+        signature_index = SignatureIndex(mapping)
         
         # 结果字典。1：test文件存在，且在列表中；2：test文件存在，但不在列表中 0：test文件不存在
         test_case_results = {file_name: 0 for file_name in modified_java_files}
@@ -309,24 +361,25 @@ def main():
             if test_case_results[java_file] == 1 or extract_filename(java_file):
                 continue
             else:
-                # 获得修改文件路径
-                java_file_path_list  = [path for path in modified_java_path if path.endswith(java_file)]
+                # 获得修改文件路径（不同包中可能有多个同名文件）
+                java_file_path_list = path_index.lookup(java_file)
                 
                 if not java_file_path_list:
                     continue
-                else:
-                    java_file_path = java_file_path_list[0]#理论上只有一个文件路径
+
+                for java_file_path in java_file_path_list:
                     java_file_path = base_path1 + '/' + repo + '/' + java_file_path
-                   
-                method_signatures = extract_method_signatures(java_file_path)  # 获得方法列表
-                
-                for method_signature in method_signatures:
-                    if method_exists(mapping, method_signature) == True:
+                    method_signatures = extract_method_signatures(java_file_path, toolkit)  # 获得方法列表
+                    
+                    if any(method_exists(signature_index, method_signature) for method_signature in method_signatures):
                         flag = 2  # 至少有一个焦点方法存在对应的测试用例
                         break
                 # flag = 0 # 没有找到对应的测试用例
                 test_case_results[java_file] = flag
 
+        # read_head 通过常驻的 git cat-file 读取HEAD，处理完一个仓库后关闭
+        close_backend(repo_path)
+
         # 将当前 URL 的 testcase 结果保存到字典中
         testcase_results[url] = test_case_results
         print(f"仓库{repo}的测试结果:{test_case_results}")
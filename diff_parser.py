@@ -0,0 +1,237 @@
+import re
+
+# diff --git a/<path> b/<path>（路径不含空格、未加引号时）
+DIFF_GIT_PATTERN = re.compile(r'^diff --git (?:"a/(?:[^"\\]|\\.)*"|a/\S+) (?:"b/(?:[^"\\]|\\.)*"|b/\S+)$')
+# @@ -旧起始行[,旧行数] +新起始行[,新行数] @@
+HUNK_PATTERN = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+# git对含特殊字符的路径使用C风格的转义
+ESCAPES = {'a': '\a', 'b': '\b', 't': '\t', 'n': '\n', 'v': '\v', 'f': '\f', 'r': '\r', '"': '"', '\\': '\\'}
+
+ADDED = 'added'
+DELETED = 'deleted'
+MODIFIED = 'modified'
+RENAMED = 'renamed'
+COPIED = 'copied'
+
+
+def unquote_path(path):
+    """
+    去掉git给路径加的引号和转义，例如 '"a/\\303\\244.java"' -> 'a/ä.java'。
+    """
+    if not (len(path) >= 2 and path[0] == '"' and path[-1] == '"'):
+        return path
+    raw = bytearray()
+    i = 1
+    while i < len(path) - 1:
+        char = path[i]
+        if char == '\\' and i + 1 < len(path) - 1:
+            following = path[i + 1]
+            if following in '01234567':
+                raw.append(int(path[i + 1:i + 4], 8))
+                i += 4
+                continue
+            raw += ESCAPES.get(following, following).encode('utf-8')
+            i += 2
+            continue
+        raw += char.encode('utf-8')
+        i += 1
+    return raw.decode('utf-8', errors='replace')
+
+
+def strip_prefix(path, prefix):
+    """
+    去掉 a/、b/ 前缀，/dev/null 返回None。
+    """
+    path = unquote_path(path.rstrip('\n').split('\t')[0])
+    if path == '/dev/null':
+        return None
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+class FileChange():
+    """
+    diff中一个文件的修改。
+
+    参数:
+        old_path (str): 修改前的路径，新增的文件为None。
+        new_path (str): 修改后的路径，删除的文件为None。
+        status (str): ADDED / DELETED / MODIFIED / RENAMED / COPIED。
+        hunks (list): 每个hunk的 (旧起始行, 旧行数, 新起始行, 新行数)。
+    """
+
+    __slots__ = ('old_path', 'new_path', 'status', 'hunks')
+
+    def __init__(self, old_path=None, new_path=None, status=MODIFIED):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.status = status
+        self.hunks = []
+
+    @property
+    def path(self):
+        """
+        修改后的路径，删除的文件为修改前的路径（与 diff --git 行中的 b/ 路径一致）。
+        """
+        return self.new_path if self.new_path is not None else self.old_path
+
+    @property
+    def paths(self):
+        """
+        修改前后的路径（去重）。
+        """
+        return [path for i, path in enumerate((self.old_path, self.new_path))
+                if path is not None and (i == 0 or path != self.old_path)]
+
+    def __repr__(self):
+        return f'FileChange({self.old_path!r}, {self.new_path!r}, {self.status!r}, {len(self.hunks)} hunks)'
+
+
+def header_paths(line):
+    """
+    从 diff --git 行中取出修改前后的路径；路径含空格时无法可靠拆分，返回 (None, None)，
+    由之后的 ---/+++ 或 rename from/to 行补上。
+    """
+    if not DIFF_GIT_PATTERN.match(line):
+        return None, None
+    if line.endswith('"'):
+        old, new = line[len('diff --git '):].rsplit(' "b/', 1)
+        new = '"b/' + new
+    else:
+        old, new = line[len('diff --git '):].rsplit(' b/', 1)
+        new = 'b/' + new
+    return strip_prefix(old, 'a/'), strip_prefix(new, 'b/')
+
+
+def parse_diff(lines):
+    """
+    逐行解析diff（只读一遍，不保存文件内容），产出每个文件的FileChange。
+
+    hunk中的内容行按 @@ 头中的行数跳过，因此以 '--- '、'diff --git' 开头的代码行不会被当成文件头。
+
+    参数:
+        lines (iterable): diff的各行，可以直接传入打开的文件。
+
+    返回:
+        generator: FileChange。
+    """
+    change = None
+    old_remaining = new_remaining = 0
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        # hunk内容
+        if old_remaining > 0 or new_remaining > 0:
+            marker = line[:1]
+            if marker == ' ' or line == '':
+                old_remaining -= 1
+                new_remaining -= 1
+                continue
+            if marker == '-':
+                old_remaining -= 1
+                continue
+            if marker == '+':
+                new_remaining -= 1
+                continue
+            if marker == '\\':
+                continue  # \ No newline at end of file
+            old_remaining = new_remaining = 0  # 不完整的hunk，按文件头继续解析
+
+        if line.startswith('diff --git '):
+            if change is not None:
+                yield change
+            old_path, new_path = header_paths(line)
+            change = FileChange(old_path, new_path)
+            continue
+        if change is None:
+            continue
+
+        if line.startswith('@@'):
+            match = HUNK_PATTERN.match(line)
+            if match:
+                old_start, old_count, new_start, new_count = match.groups()
+                old_count = int(old_count) if old_count is not None else 1
+                new_count = int(new_count) if new_count is not None else 1
+                change.hunks.append((int(old_start), old_count, int(new_start), new_count))
+                old_remaining, new_remaining = old_count, new_count
+        elif line.startswith('new file mode'):
+            change.status = ADDED
+            change.old_path = None
+        elif line.startswith('deleted file mode'):
+            change.status = DELETED
+            change.new_path = None
+        elif line.startswith('rename from '):
+            change.status = RENAMED
+            change.old_path = unquote_path(line[len('rename from '):])
+        elif line.startswith('rename to '):
+            change.new_path = unquote_path(line[len('rename to '):])
+        elif line.startswith('copy from '):
+            change.status = COPIED
+            change.old_path = unquote_path(line[len('copy from '):])
+        elif line.startswith('copy to '):
+            change.new_path = unquote_path(line[len('copy to '):])
+        elif line.startswith('--- '):
+            change.old_path = strip_prefix(line[4:], 'a/')
+        elif line.startswith('+++ '):
+            change.new_path = strip_prefix(line[4:], 'b/')
+
+    if change is not None:
+        yield change
+
+
+def read_file_changes(diff_file_path):
+    """
+    读取diff文件中的所有FileChange，文件不存在时返回空列表。
+    """
+    try:
+        with open(diff_file_path, 'r', encoding='utf-8') as file:
+            return list(parse_diff(file))
+    except FileNotFoundError:
+        return []
+
+
+class PathIndex():
+    """
+    修改文件路径的索引，每个diff建立一次。
+
+    - names：文件名 -> 路径列表，按文件名查找为O(1)
+    - 后缀树：从文件名开始按目录逐级向上的嵌套字典，可以按带包名的后缀查找，
+      例如 'p/A.java' 只匹配 .../p/A.java，而不匹配 .../q/A.java 或 .../p/MyA.java
+
+    参数:
+        paths (iterable): 以/分隔的文件路径。
+    """
+
+    def __init__(self, paths=()):
+        self.names = {}
+        self.trie = {}  # 路径组成部分 -> 子节点，节点的None键保存以该后缀结尾的路径
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        parts = path.split('/')
+        self.names.setdefault(parts[-1], []).append(path)
+        node = self.trie
+        for part in reversed(parts):
+            node = node.setdefault(part, {})
+            node.setdefault(None, []).append(path)
+
+    def __len__(self):
+        return sum(len(paths) for paths in self.names.values())
+
+    def lookup(self, suffix):
+        """
+        返回以suffix结尾的所有路径（按完整的路径组成部分匹配），没有时返回空列表。
+
+        参数:
+            suffix (str): 文件名，或带目录的后缀，例如 'A.java'、'com/example/A.java'。
+        """
+        parts = suffix.strip('/').split('/')
+        if len(parts) == 1:
+            return list(self.names.get(parts[0], []))
+        node = self.trie
+        for part in reversed(parts):
+            node = node.get(part)
+            if node is None:
+                return []
+        return list(node[None])
@@ -0,0 +1,45 @@
+import os
+import re
+from atomic_file import write_atomic
+
+# 提交哈希只允许十六进制字符，避免拼出奇怪的路径
+COMMIT_HASH_PATTERN = re.compile(r'^[0-9a-fA-F]{4,64}$')
+
+
+class DiffStore():
+    """
+    以 <repo>/<commit_hash>.diff 保存每个提交的diff内容。
+
+    同一个提交的diff只需要生成一次，之后的运行以及testcase阶段都直接读取；
+    一个仓库有多个提交时各自保存，不会像diff.txt那样互相覆盖。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, repo, commit_hash):
+        """
+        返回某个提交的diff文件路径，提交哈希不合法时返回None。
+        """
+        if not commit_hash or not COMMIT_HASH_PATTERN.match(commit_hash):
+            return None
+        return os.path.join(self.root, repo, commit_hash.lower() + '.diff')
+
+    def get(self, repo, commit_hash):
+        """
+        读取已保存的diff，不存在时返回None。
+        """
+        path = self.path(repo, commit_hash)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            return file.read()
+
+    def put(self, repo, commit_hash, diff_output):
+        """
+        保存diff。先写临时文件再替换，多个线程同时写同一个提交也不会得到不完整的文件。
+        """
+        path = self.path(repo, commit_hash)
+        if path is None or not diff_output:
+            return
+        write_atomic(path, diff_output)
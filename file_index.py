@@ -0,0 +1,132 @@
+import os
+import json
+import threading
+from repository import Repository
+from atomic_file import write_atomic
+
+# 文件名或路径中包含这些关键字的文件视为测试文件
+TEST_KEYWORDS = ('test', 'tests')
+
+# 进程内缓存：仓库路径 -> RepositoryFileIndex
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class RepositoryFileIndex():
+    """
+    仓库中所有文件的索引（路径、扩展名、是否为测试文件）。
+
+    建立一次后保存在仓库旁边的 .file_index/<repo>.json 中，以HEAD的提交哈希判断是否过期；
+    进程内用get_file_index复用，"是否有测试文件"、"Java文件列表"等查询直接在内存中完成。
+
+    参数:
+        head (str): 建立索引时HEAD的提交哈希。
+        paths (list): 相对于仓库根目录、以/分隔的文件路径。
+    """
+
+    def __init__(self, head, paths):
+        self.head = head
+        self.paths = paths
+        self.test_paths = [path for path in paths if self.is_test_path(path)]
+        self.by_extension = {}
+        for path in paths:
+            self.by_extension.setdefault(os.path.splitext(path)[1].lower(), []).append(path)
+
+    @staticmethod
+    def is_test_path(path):
+        """
+        文件名或所在目录中包含测试关键字即视为测试文件（与count_test_files的判断相同）。
+        """
+        path = path.lower()
+        return any(keyword in path for keyword in TEST_KEYWORDS)
+
+    def has_tests(self):
+        return bool(self.test_paths)
+
+    def files_with_extension(self, extension):
+        return self.by_extension.get(extension.lower(), [])
+
+    def java_files(self):
+        return self.files_with_extension('.java')
+
+    def test_files(self):
+        return self.test_paths
+
+    def test_classes(self):
+        return [path for path in self.test_paths if path.lower().endswith('.java')]
+
+    def to_dict(self):
+        return {'head': self.head, 'paths': self.paths}
+
+
+def index_path(repo_path):
+    """
+    索引文件的位置：与仓库目录同级的 .file_index/<repo>.json。
+    """
+    repo_path = os.path.abspath(repo_path)
+    return os.path.join(os.path.dirname(repo_path), '.file_index', os.path.basename(repo_path) + '.json')
+
+
+def read_head(repository):
+    """
+    返回HEAD的提交哈希，不是git仓库时返回None。
+    """
+    if not repository.exists():
+        return None
+    try:
+        obj = repository.backend().read_object('HEAD^{commit}')
+    except OSError:
+        return None  # git进程无法启动或立即退出
+    return obj[0] if obj is not None else None
+
+
+def list_files(repository):
+    """
+    列出仓库中的文件：git仓库用 git ls-files（包含sparse checkout中未检出的文件），
+    否则遍历目录。
+    """
+    result = repository.git('ls-files', '-z')
+    if result.returncode == 0:
+        return [os.fsdecode(path) for path in result.stdout.split(b'\0') if path]
+    paths = []
+    for root, dirs, files in os.walk(repository.path):
+        dirs[:] = [d for d in dirs if d != '.git']
+        for file in files:
+            paths.append(os.path.relpath(os.path.join(root, file), repository.path).replace('\\', '/'))
+    return paths
+
+
+def build_file_index(repo_path):
+    """
+    读取或建立仓库的文件索引，HEAD没有变化时直接使用保存的索引。
+    """
+    repository = Repository(repo_path)
+    head = read_head(repository)
+    path = index_path(repo_path)
+
+    if head is not None and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('head') == head:
+                return RepositoryFileIndex(head, data['paths'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    index = RepositoryFileIndex(head, list_files(repository) if repository.exists() else [])
+    if head is not None:
+        write_atomic(path, json.dumps(index.to_dict()))
+    return index
+
+
+def get_file_index(repo_path):
+    """
+    返回仓库的文件索引，同一个仓库在进程中只读取/建立一次。
+    """
+    key = os.path.abspath(repo_path)
+    with _indexes_lock:
+        if key in _indexes:
+            return _indexes[key]
+    index = build_file_index(repo_path)
+    with _indexes_lock:
+        return _indexes.setdefault(key, index)
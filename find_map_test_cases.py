@@ -3,19 +3,130 @@ import re
 import csv
 import json
 import argparse
-import subprocess
 import difflib
 import shutil
 import multiprocessing
 import tqdm
-import copy
-import glob
-import fnmatch
-from TestParser import TestParser
+import atexit
+from TestParser import TestParser, configure_parse_cache
+from repository import Repository
+from mapping_cache import MappingCache, RepositoryMappingCache
 
+# Parsers shared by every repository analyzed in this process: (grammar_file, language) -> TestParser
+_parsers = {}
 
+# Parse pools shared by every repository: (grammar_file, language, processes) -> ParsePool
+_pools = {}
 
-def analyze_project(repo_path, repo_name, grammar_file, output):
+# TestParser of a pool worker process, created once by init_worker
+_worker_parser = None
+
+
+def get_test_parser(grammar_file, language='java'):
+    """
+    Return the TestParser for a grammar, loading the grammar only once per process.
+    """
+    key = (grammar_file, language)
+    if key not in _parsers:
+        _parsers[key] = TestParser(grammar_file, language)
+    return _parsers[key]
+
+
+def init_worker(grammar_file, language):
+    """
+    Pool initializer: load the grammar once per worker process
+    Workers never see the same file twice, so their parse cache is disabled
+    """
+    global _worker_parser
+    configure_parse_cache(0)
+    _worker_parser = TestParser(grammar_file, language)
+
+
+def parse_file_in_worker(file):
+    return _worker_parser.parse_file(file)
+
+
+class ParsePool():
+    """
+    Process pool with one TestParser per worker.
+    Files are sharded across the workers and the results come back in input order.
+    """
+
+    def __init__(self, grammar_file, language, processes):
+        self.processes = processes
+        self.pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(grammar_file, language))
+
+    def parse_many(self, files):
+        chunksize = max(1, len(files) // (self.processes * 4))
+        results = self.pool.imap(parse_file_in_worker, files, chunksize)
+        return list(tqdm.tqdm(results, total=len(files), desc="Parsing", unit="file", leave=False))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def get_parse_pool(grammar_file, language='java', processes=1):
+    """
+    Return the ParsePool for a grammar, or None for sequential parsing (processes <= 1).
+    The pool is started once and reused across repositories.
+    """
+    if processes is None or processes <= 1:
+        return None
+    key = (grammar_file, language, processes)
+    if key not in _pools:
+        _pools[key] = ParsePool(grammar_file, language, processes)
+    return _pools[key]
+
+
+def close_parse_pools():
+    """
+    Stop the worker processes of all the parse pools
+    """
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_parse_pools)
+
+
+def focal_method_signatures(repo_path, repo_name, grammar_file, output=None, language='java', cache_dir=None,
+                            processes=1):
+    """
+    In-process API: map the test cases of an already cloned repository and return
+    the focal-method signatures (the content of <repo_name>_signature.json).
+
+    The TestParser is reused across calls. When output is given, log.txt and the
+    signature JSON are written to <output>/<repo_name> as the CLI does.
+    With cache_dir, per-file parse results are kept in a MappingCache so a rerun
+    only parses the files whose blobs changed.
+    With processes > 1, test and focal classes are parsed by a pool of worker processes.
+    """
+    repo = {"url": repo_path, "repo_name": repo_name}
+    parser = get_test_parser(grammar_file, language)
+    pool = get_parse_pool(grammar_file, language, processes)
+    cache = MappingCache(cache_dir) if cache_dir else None
+
+    if output is None:
+        log = open(os.devnull, "w")
+    else:
+        repo_out = os.path.join(output, str(repo_name))
+        os.makedirs(repo_out, exist_ok=True)
+        log = open(os.path.join(repo_out, "log.txt"), "w")
+
+    with log:
+        stats, mtc_list = map_test_cases(repo_path, parser, log, cache, pool)
+        write_stats(stats, log)
+
+    signatures = mtc_signatures(mtc_list)
+    if output is not None and len(mtc_list) > 0:
+        export_mtc(repo, mtc_list, repo_out)
+    return signatures
+
+
+def analyze_project(repo_path, repo_name, grammar_file, output, cache_dir=None, processes=1):
     """
     Analyze a single project using an already cloned repository.
     """
@@ -31,7 +142,7 @@ def analyze_project(repo_path, repo_name, grammar_file, output):
     # Run analysis
     language = 'java'
     print("Extracting and mapping tests...")
-    tot_mtc = find_map_test_cases(repo_path, grammar_file, language, repo_out, repo)
+    tot_mtc = find_map_test_cases(repo_path, grammar_file, language, repo_out, repo, cache_dir, processes)
     (tot_tclass, tot_tc, tot_tclass_fclass, tot_mtc) = tot_mtc
 
     # Print Stats
@@ -45,23 +156,11 @@ def find_test_classes(root):
     """
     查找包含 @Test 注释的 Java 测试类文件。
     """
-    tests = []
-    
-    # 遍历目录
-    for dirpath, _, filenames in os.walk(root):
-        for filename in fnmatch.filter(filenames, '*.java'):
-            file_path = os.path.join(dirpath, filename)
-            with open(file_path, 'r', encoding='utf-8') as file:
-                try:
-                    # 检查文件中是否包含 @Test
-                    if any('@Test' in line for line in file):
-                        tests.append(file_path)
-                except Exception as e:
-                    print("Error reading {file_path}: {e}\n")
-
-    return tests
-
-def find_map_test_cases(root, grammar_file, language, output, repo):
+    repository = Repository(root)
+    tests, _ = repository.scan_files(b'@Test', '*.java')
+    return [repository.join(test) for test in tests]
+
+def find_map_test_cases(root, grammar_file, language, output, repo, cache_dir=None, processes=1):
     """
     Finds test cases using @Test annotation
     Maps Test Classes -> Focal Class
@@ -69,40 +168,64 @@ def find_map_test_cases(root, grammar_file, language, output, repo):
     """
     # Logging
     log_path = os.path.join(output, "log.txt")
-    log = open(log_path, "w")
+    with open(log_path, "w") as log:
+        cache = MappingCache(cache_dir) if cache_dir else None
+        pool = get_parse_pool(grammar_file, language, processes)
+        stats, mtc_list = map_test_cases(root, get_test_parser(grammar_file, language), log, cache, pool)
 
-    # Move to folder
-    if os.path.exists(root):
-        os.chdir(root)
-    else:
-        return 0, 0, 0, 0
+        # Export Mapped Test Cases
+        if len(mtc_list) > 0:
+            export_mtc(repo, mtc_list, output)
 
-    #获得Test Classes
-    try:
-        # print("执行grep -l -r @Test --include \*.java命令")
-        result = subprocess.check_output(r'grep -l -r @Test --include \*.java', shell=True)
-        tests = result.decode('ascii').splitlines()
-    except:
-        print("命令执行失败")
-        log.write("Error during grep" + '\n')
-        return 0, 0, 0, 0
-
-    # Java Files
+        write_stats(stats, log)
+    return stats
+
+
+def find_java_files(repository, log):
+    """
+    Finds the Test Classes (files containing @Test) and all the Java files of a repository
+    Returns None if the search fails
+    """
+    # Test Classes and Java Files from one traversal (mmap byte search for @Test)
     try:
-        # result = subprocess.check_output(['find', '-name', '*.java'])
-        
-        java = glob.glob(os.path.join(root, '**', '*.java'), recursive=True)
-        java = [os.path.relpath(file, root).replace('\\', '/') for file in java]
-        java = [j.replace("./", "") for j in java]
+        tests, java = repository.scan_files(b'@Test', '*.java')
     except Exception as e:
         log.write(f"Error during finding Java files: {str(e)}\n")
-        return 0, 0, 0, 0
+        return None
+    return tests, java
 
 
+def map_test_cases(root, parser, log, cache=None, pool=None):
+    """
+    Maps Test Classes -> Focal Class and Test Case -> Focal Method for one repository
+    Returns the stats (tot_tclass, tot_tc, tot_tclass_fclass, tot_mtc) and the list
+    of mapped test cases per test class
+
+    With a MappingCache, unchanged files (same blob) are not parsed again and the
+    file lists are reused while HEAD does not move
+    With a ParsePool, the classes are parsed in parallel before matching
+    """
+    # Repository handle (no chdir, paths stay relative to root)
+    repository = Repository(root)
+    if not repository.exists():
+        return (0, 0, 0, 0), []
+
+    files = None
+    if cache is not None:
+        parser = cache.for_repository(repository, parser)
+        files = parser.load_files()
+    if files is None:
+        files = find_java_files(repository, log)
+        if files is None:
+            return (0, 0, 0, 0), []
+        if cache is not None:
+            parser.store_files(*files)
+    tests, java = files
+
     # Potential Focal Classes
     focals = list(set(java) - set(tests))
     focals = [f for f in focals if not "src/test" in f]
-    focals_norm = [f.lower() for f in focals]
+    focals_by_norm = name_index(focals, str.lower)
     
     log.write("Java Files: " + str(len(java)) + '\n')
     log.write("Test Classes: " + str(len(tests)) + '\n')
@@ -118,10 +241,13 @@ def find_map_test_cases(root, grammar_file, language, output, repo):
         tests_norm = test.lower().replace("/src/test/", "/src/main/")
         tests_norm = tests_norm.replace("test", "")
         
-        if tests_norm in focals_norm:
-            index = focals_norm.index(tests_norm)
-            focal = focals[index]
+        candidates = focals_by_norm.get(tests_norm)
+        if candidates:
+            focal = candidates[0]
             mapped_tests[test] = focal
+            if len(candidates) > 1:
+                log.write("Ambiguous Focal Class for " + test + ": " + ", ".join(candidates)
+                          + " (using " + focal + ")" + '\n')
 
     log.write("Perfect Matches Found: " + str(len(mapped_tests)) + '\n')
 
@@ -134,14 +260,20 @@ def find_map_test_cases(root, grammar_file, language, output, repo):
     # Map Test Case -> Focal Method
     log.write("Mapping test cases" + '\n')
     mtc_list = list()
-    parser = TestParser(grammar_file, language)
+
+    # Parse every test and focal class once, then match in the order of mapped_tests
+    files = list(dict.fromkeys(repository.join(path) for pair in mapped_tests.items() for path in pair))
+    parsed_files = parse_files(parser, files, pool)
+
     for test, focal in mapped_tests.items():
         log.write("----------" + '\n')
         log.write("Test: " + test + '\n')
         log.write("Focal: " + focal + '\n')
 
-        test_cases = parse_test_cases(parser, test)
-        focal_methods = parse_potential_focal_methods(parser, focal)
+        test_file = repository.join(test)
+        focal_file = repository.join(focal)
+        test_cases = parse_test_cases(parser, test_file, parsed_files[test_file])
+        focal_methods = parse_potential_focal_methods(parser, focal_file, parsed_files[focal_file])
         tot_tc += len(test_cases)
 
         mtc = match_test_cases(test, focal, test_cases, focal_methods, log)
@@ -151,65 +283,84 @@ def find_map_test_cases(root, grammar_file, language, output, repo):
         if mtc_size > 0:
             mtc_list.append(mtc)
 
-    # Export Mapped Test Cases
-    if len(mtc_list) > 0:
-        export_mtc(repo, mtc_list, output)
+    if cache is not None:
+        log.write("Parsed Files: " + str(parser.misses) + ", From Cache: " + str(parser.hits) + '\n')
 
-    # Print Stats
+    return (tot_tclass, tot_tc, tot_tclass_fclass, tot_mtc), mtc_list
+
+
+def write_stats(stats, log):
+    """
+    Write the final stats of a repository to the log
+    """
+    (tot_tclass, tot_tc, tot_tclass_fclass, tot_mtc) = stats
     log.write("==============" + '\n')
     log.write("Test Classes: " + str(tot_tclass) + '\n')
     log.write("Mapped Test Classes: " + str(tot_tclass_fclass) + '\n')
     log.write("Test Cases: " + str(tot_tc) + '\n')
     log.write("Mapped Test Cases: " + str(tot_mtc) + '\n')
 
-    log.close()
-    return tot_tclass, tot_tc, tot_tclass_fclass, tot_mtc
 
 
+def parse_files(parser, files, pool=None):
+    """
+    Parse source files, sharded across the workers of pool if given
+    Returns {file: parsed classes}; small batches are parsed in this process
+    """
+    test_parser = parser.parser if isinstance(parser, RepositoryMappingCache) else parser
+
+    def parse_many(files):
+        if pool is None or len(files) < 2 * pool.processes:
+            return [test_parser.parse_file(file) for file in files]
+        return pool.parse_many(files)
+
+    if isinstance(parser, RepositoryMappingCache):
+        return parser.parse_files(files, parse_many)
+    return dict(zip(files, parse_many(files)))
 
-def parse_test_cases(parser, test_file):
+
+def parse_test_cases(parser, test_file, parsed_classes=None):
     """
     Parse source file and extracts test cases
     """
-    parsed_classes = parser.parse_file(test_file)
+    if parsed_classes is None:
+        parsed_classes = parser.parse_file(test_file)
 
     test_cases = list()
 
     for parsed_class in parsed_classes:
-        for method in parsed_class['methods']:
-            if method['testcase']:
-
-                #Test Class Info
-                test_case_class = dict(parsed_class)
-                test_case_class.pop('methods')
-                test_case_class.pop('argument_list')
-                test_case_class['file'] = test_file
-                method['class'] = test_case_class
+        #Test Class Info (shared by the test cases of the class)
+        test_case_class = dict(parsed_class)
+        test_case_class.pop('methods')
+        test_case_class.pop('argument_list')
+        test_case_class['file'] = test_file
 
+        for method in parsed_class['methods']:
+            if method.testcase:
+                method.class_info = test_case_class
                 test_cases.append(method)
     
     return test_cases
 
 
-def parse_potential_focal_methods(parser, focal_file):
+def parse_potential_focal_methods(parser, focal_file, parsed_classes=None):
     """
     Parse source file and extracts potential focal methods (non test cases)
     """
-    parsed_classes = parser.parse_file(focal_file)
+    if parsed_classes is None:
+        parsed_classes = parser.parse_file(focal_file)
 
     potential_focal_methods = list()
 
     for parsed_class in parsed_classes:
-        for parsed_method in parsed_class['methods']:
-            method = dict(parsed_method)
-            if not method['testcase']: #and not method['constructor']:
-
-                #Class Info
-                focal_class = dict(parsed_class)
-                focal_class.pop('argument_list')
+        #Class Info (shared by the methods of the class)
+        focal_class = dict(parsed_class)
+        focal_class.pop('argument_list')
+        focal_class['file'] = focal_file
 
-                focal_class['file'] = focal_file
-                method['class'] = focal_class
+        for method in parsed_class['methods']:
+            if not method.testcase: #and not method.constructor:
+                method.class_info = focal_class
 
                 potential_focal_methods.append(method)
     
@@ -217,6 +368,17 @@ def parse_potential_focal_methods(parser, focal_file):
 
 
 
+def name_index(items, key):
+    """
+    Multi-valued index: normalized name -> items with that name, in their original order
+    The first item of each list is the one a linear search would find
+    """
+    index = {}
+    for item in items:
+        index.setdefault(key(item), []).append(item)
+    return index
+
+
 def match_test_cases(test_class, focal_class, test_cases, focal_methods, log):
     """
     Map Test Case -> Focal Method
@@ -227,16 +389,16 @@ def match_test_cases(test_class, focal_class, test_cases, focal_methods, log):
     #Mapped Test Cases
     mapped_test_cases = list()
 
-    focals_norm = [f['identifier'].lower() for f in focal_methods]
+    focals_by_name = name_index(focal_methods, lambda f: f.identifier.lower())
     for test_case in test_cases:
-        test_case_norm = test_case['identifier'].lower().replace("test", "")
-        log.write("Test-Case: " + test_case['identifier'] + '\n')
+        test_case_norm = test_case.identifier.lower().replace("test", "")
+        log.write("Test-Case: " + test_case.identifier + '\n')
 
         #Matching Strategies
-        if test_case_norm in focals_norm:
+        if test_case_norm in focals_by_name:
             #Name Matching
-            index = focals_norm.index(test_case_norm)
-            focal = focal_methods[index]
+            candidates = focals_by_name[test_case_norm]
+            focal = candidates[0]
             
             mapped_test_case = {}
             mapped_test_case['test_class'] = test_class
@@ -245,16 +407,17 @@ def match_test_cases(test_class, focal_class, test_cases, focal_methods, log):
             mapped_test_case['focal_method'] = focal
 
             mapped_test_cases.append(mapped_test_case)
-            log.write("> Found Focal-Method:" + focal['identifier'] + '\n')
+            log.write("> Found Focal-Method:" + focal.identifier + '\n')
+            log_overloads(candidates, log)
         
         else:
             #Single method invoked that is in the focal class
-            invoc_norm = [i.lower() for i in test_case['invocations']]
-            overlap_invoc = list(set(invoc_norm).intersection(set(focals_norm)))
+            invoc_norm = [i.lower() for i in test_case.invocations]
+            overlap_invoc = list(set(invoc_norm).intersection(focals_by_name))
             if len(overlap_invoc) == 1:
 
-                index = focals_norm.index(overlap_invoc[0])
-                focal = focal_methods[index]
+                candidates = focals_by_name[overlap_invoc[0]]
+                focal = candidates[0]
 
                 mapped_test_case = {}
                 mapped_test_case['test_class'] = test_class
@@ -263,15 +426,25 @@ def match_test_cases(test_class, focal_class, test_cases, focal_methods, log):
                 mapped_test_case['focal_method'] = focal
 
                 mapped_test_cases.append(mapped_test_case)
-                log.write("> [Single-Invocation] Found Focal-Method:" + focal['identifier'] + '\n')
+                log.write("> [Single-Invocation] Found Focal-Method:" + focal.identifier + '\n')
+                log_overloads(candidates, log)
     
     log.write("+++++++++" + '\n')
     log.write("Test-Cases: " + str(len(test_cases)) + '\n')
-    log.write("Focal Methods: " + str(len(focals_norm)) + '\n')
+    log.write("Focal Methods: " + str(len(focal_methods)) + '\n')
     log.write("Mapped Test Cases: " + str(len(mapped_test_cases)) + '\n')
     return mapped_test_cases
 
 
+def log_overloads(candidates, log):
+    """
+    Report a name match that is ambiguous because the focal method is overloaded
+    """
+    if len(candidates) > 1:
+        log.write("> Ambiguous: " + str(len(candidates)) + " focal methods with this name, using "
+                  + candidates[0].signature + '\n')
+
+
 def read_repositories(json_file_path):
     """
     Read the repository java file
@@ -281,33 +454,29 @@ def read_repositories(json_file_path):
     return data
 
 
-def export_mtc(repo, mtc_list, output):
+def mtc_signatures(mtc_list):
     """
-    Export a JSON file representing the Mapped Test Case (mtc)
-    It contains info on the Test and Focal Class, and Test and Focal method
+    Focal-method signatures of the Mapped Test Cases (mtc), whitespace normalized
     """
-    mtc_id = 0
-    all_mtcs = []  # 创建一个列表来存储所有的mtc对象
+    all_mtcs = []  # 创建一个列表来存储所有的方法签名
 
     for mtc_file in mtc_list:
-        for mtc_p in mtc_file:
-            mtc = copy.deepcopy(mtc_p)
-            mtc['test_class'] = mtc['test_case'].pop('class')
-            mtc['focal_class'] = mtc['focal_method'].pop('class')
-            mtc['repository'] = repo
-
-            # Clean Focal Class data
-            for fmethod in mtc['focal_class']['methods']:
-                fmethod.pop('body')
-                fmethod.pop('class')
-                fmethod.pop('invocations')
-            
-            method = mtc['focal_method']['signature']
+        for mtc in mtc_file:
+            # 只用到焦点方法的签名，不需要复制测试用例和类的元数据
+            method = mtc['focal_method'].signature
             # 去掉\n和空格
             method = re.sub(r',\n\s*', ', ', method)
             method = re.sub(r'\n\s*', '', method)
-            all_mtcs.append(method)  # 将mtc对象添加到列表中
-            mtc_id += 1
+            all_mtcs.append(method)
+    return all_mtcs
+
+
+def export_mtc(repo, mtc_list, output):
+    """
+    Export a JSON file representing the Mapped Test Case (mtc)
+    It contains the focal-method signatures of all the mapped test cases
+    """
+    all_mtcs = mtc_signatures(mtc_list)
 
     mtc_file = str(repo["repo_name"]) + "_signature.json"  # 使用repo名称作为文件名
     json_path = os.path.join(output, mtc_file)  # 构建完整的文件路径
@@ -356,6 +525,20 @@ def parse_args():
         help="Path to the output folder",
     )
 
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=None,
+        help="Folder of the per-file parse cache (disabled if not given)",
+    )
+
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse test and focal classes",
+    )
+
     return vars(parser.parse_args())
 
 
@@ -366,7 +549,7 @@ def main():
     grammar_file = args['grammar']
     output = args['output']
     local_repo_path = os.path.join(repo_git)  # 确保传入的是本地路径
-    analyze_project(local_repo_path, repo_name, grammar_file, output)
+    analyze_project(local_repo_path, repo_name, grammar_file, output, args['cache'], args['processes'])
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
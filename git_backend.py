@@ -0,0 +1,219 @@
+import os
+import uuid
+import atexit
+import threading
+import subprocess
+from collections import OrderedDict
+
+# 同时保留的GitBackend数量上限（每个最多两个git进程），超过时关闭最久未使用的仓库
+MAX_BACKENDS = 16
+
+# 每个仓库一个GitBackend，按最近使用的顺序排列
+_backends = OrderedDict()
+_backends_lock = threading.Lock()
+
+
+def stop_process(process):
+    """
+    关闭进程的输入，等待git退出，返回None。
+    """
+    if process is not None and process.poll() is None:
+        process.stdin.close()
+        process.wait()
+    return None
+
+
+class GitBackend():
+    """
+    一个仓库对应的常驻git进程。
+
+    - git cat-file --batch：读取提交、blob等对象（支持 <rev>:<path> 形式）
+    - git diff-tree --stdin：生成提交相对于第一个父提交的diff，与 git diff sha^..sha 的输出相同
+
+    两个进程在第一次使用时启动，之后所有请求都复用它们，省去每个提交启动shell和git的开销。
+    每个进程有自己的锁，可以在多个线程中共用。
+    close之后仍在使用它的请求照常完成，请求结束时关闭重新启动的进程。
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.cat_file = None
+        self.diff_tree = None
+        self.cat_file_lock = threading.Lock()
+        self.diff_tree_lock = threading.Lock()
+        self.closed = False
+        # diff-tree会原样输出无法解析的行，用它标记一次请求的输出结束
+        self.sentinel = ('--end-of-diff-' + uuid.uuid4().hex).encode('ascii')
+
+    def start(self, args):
+        return subprocess.Popen(['git', '-C', self.repo_path, *args],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read_object(self, name):
+        """
+        读取一个对象。
+
+        参数:
+            name (str): 对象名，例如提交哈希、'<sha>^:src/A.java'。
+
+        返回:
+            tuple: (完整哈希, 类型, 内容bytes)，对象不存在时返回None。
+        """
+        if not name or '\n' in name:
+            return None
+        with self.cat_file_lock:
+            try:
+                return self.request_object(name)
+            finally:
+                if self.closed:
+                    self.cat_file = stop_process(self.cat_file)
+
+    def request_object(self, name):
+        """
+        向cat-file进程发送一次请求，调用时需要持有cat_file_lock。
+        """
+        for attempt in range(2):
+            if self.cat_file is None or self.cat_file.poll() is not None:
+                self.cat_file = self.start(['cat-file', '--batch'])
+            try:
+                self.cat_file.stdin.write(name.encode('utf-8') + b'\n')
+                self.cat_file.stdin.flush()
+                header = self.cat_file.stdout.readline()
+                if not header:
+                    raise BrokenPipeError(name)
+                # 对象不存在时回复 "<name> missing"，name中可能有空格，不能只看字段数
+                if header.endswith((b' missing\n', b' ambiguous\n')):
+                    return None
+                fields = header.split()
+                if len(fields) != 3 or not fields[2].isdigit():
+                    return None
+                size = int(fields[2])
+                content = self.cat_file.stdout.read(size)
+                self.cat_file.stdout.read(1)  # 内容后的换行
+                return fields[0].decode('ascii'), fields[1].decode('ascii'), content
+            except (BrokenPipeError, OSError):
+                # 进程意外退出时重启一次
+                self.cat_file = None
+                if attempt == 1:
+                    raise
+
+    def read_blob(self, revision, path):
+        """
+        读取某个版本中的文件内容，不存在时返回None。
+        """
+        obj = self.read_object(f'{revision}:{path}')
+        if obj is None or obj[1] != 'blob':
+            return None
+        return obj[2]
+
+    def commit_parents(self, commit_hash):
+        """
+        返回 (完整哈希, 父提交列表)，提交不存在时返回None。
+        """
+        obj = self.read_object(commit_hash + '^{commit}')
+        if obj is None:
+            return None
+        parents = []
+        for line in obj[2].split(b'\n'):
+            if not line:
+                break  # 提交头结束
+            if line.startswith(b'parent '):
+                parents.append(line[len(b'parent '):].decode('ascii'))
+        return obj[0], parents
+
+    def diff(self, commit_hash):
+        """
+        生成提交相对于第一个父提交的diff，等价于 git diff sha^..sha。
+
+        返回:
+            str: diff内容；提交不存在或没有父提交时返回空字符串（与 git diff 失败时一致）。
+        """
+        commit = self.commit_parents(commit_hash)
+        if commit is None or not commit[1]:
+            return ''
+        sha, parents = commit
+        with self.diff_tree_lock:
+            try:
+                chunks = self.request_diff(sha, parents[0])
+            finally:
+                if self.closed:
+                    self.diff_tree = stop_process(self.diff_tree)
+        # 与文本模式读取子进程输出时一样统一换行符
+        diff_output = b''.join(chunks).decode('utf-8', errors='ignore')
+        return diff_output.replace('\r\n', '\n').replace('\r', '\n')
+
+    def request_diff(self, sha, parent):
+        """
+        向diff-tree进程发送一次请求，返回输出的各行，调用时需要持有diff_tree_lock。
+        """
+        if self.diff_tree is None or self.diff_tree.poll() is not None:
+            self.diff_tree = self.start(['diff-tree', '--stdin', '-p', '-M', '-r', '--no-commit-id'])
+        # "<commit> <parent>" 表示把commit与给定的父提交比较
+        self.diff_tree.stdin.write(f'{sha} {parent}\n'.encode('ascii') + self.sentinel + b'\n')
+        self.diff_tree.stdin.flush()
+        chunks = []
+        while True:
+            line = self.diff_tree.stdout.readline()
+            if not line:
+                self.diff_tree = None
+                break
+            if line.rstrip(b'\n') == self.sentinel:
+                break
+            chunks.append(line)
+        return chunks
+
+    def close(self):
+        """
+        结束两个git进程；正在进行的请求先完成。
+        """
+        self.closed = True
+        with self.cat_file_lock:
+            self.cat_file = stop_process(self.cat_file)
+        with self.diff_tree_lock:
+            self.diff_tree = stop_process(self.diff_tree)
+
+
+def get_backend(repo_path):
+    """
+    获取仓库对应的GitBackend，同一个仓库共用一个。
+
+    最多保留MAX_BACKENDS个仓库的git进程，超过时关闭最久未使用的仓库；
+    被关闭的仓库再次使用时重新启动。
+    """
+    key = os.path.abspath(repo_path)
+    evicted = []
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = _backends[key] = GitBackend(repo_path)
+            while len(_backends) > MAX_BACKENDS:
+                evicted.append(_backends.popitem(last=False)[1])
+        else:
+            _backends.move_to_end(key)
+    for old_backend in evicted:
+        old_backend.close()
+    return backend
+
+
+def close_backend(repo_path):
+    """
+    结束一个仓库的常驻git进程，例如处理完该仓库的最后一个提交后。
+    """
+    with _backends_lock:
+        backend = _backends.pop(os.path.abspath(repo_path), None)
+    if backend is not None:
+        backend.close()
+
+
+def close_backends():
+    """
+    结束所有常驻的git进程。
+    """
+    with _backends_lock:
+        backends = list(_backends.values())
+        _backends.clear()
+    for backend in backends:
+        backend.close()
+
+
+atexit.register(close_backends)
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from atomic_file import write_atomic
+
+# 需要缓存的状态码（404也缓存，用来记住仓库已经不存在）
+CACHEABLE_STATUS = {200, 404}
+# 缓存中保留的响应头
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Content-Type')
+
+
+class CachedResponse():
+    """
+    HttpClient.get的返回值，只包含流程中用到的字段。
+    """
+
+    def __init__(self, url, status_code, headers, text, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.from_cache = from_cache
+
+    def cached_copy(self):
+        return CachedResponse(self.url, self.status_code, self.headers, self.text, True)
+
+    def to_dict(self):
+        return {'url': self.url, 'status_code': self.status_code, 'headers': self.headers, 'text': self.text}
+
+
+class HttpClient():
+    """
+    共享的HTTP客户端。
+
+    - 连接池：所有线程共用一个requests.Session
+    - 条件请求：缓存过期后带上 If-None-Match/If-Modified-Since，304时直接使用缓存内容
+      （GitHub的304响应不计入API限额）
+    - 缓存：本次运行内存中缓存，cache_dir不为空时同时保存到磁盘，超过max_age的缓存文件被删除
+
+    参数:
+        cache_dir (str): 磁盘缓存目录，None表示只在内存中缓存。
+        ttl (int): 缓存的有效期（秒），有效期内不发送请求。
+        max_age (int): 磁盘缓存的最长保留时间（秒），过了ttl但未超过max_age的缓存用于条件请求。
+        pool_size (int): 连接池大小，一般不小于线程数。
+        headers (dict): 每个请求都带上的请求头。
+        rate_limiter (RateLimiter): 可选，按GitHub的剩余额度调度请求，被限流时等待后重试。
+        max_retries (int): 被限流时的最大重试次数。
+    """
+
+    def __init__(self, cache_dir=None, ttl=24 * 3600, max_age=30 * 24 * 3600, pool_size=16, headers=None,
+                 rate_limiter=None, max_retries=3):
+        self.cache_dir = cache_dir
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.ttl = ttl
+        self.max_age = max_age
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self.memory = {}  # key -> (保存时间, CachedResponse)
+        self.lock = threading.Lock()
+        self.key_locks = {}  # 同一个url同时只发送一个请求
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.evict()
+
+    @staticmethod
+    def cache_key(url, headers):
+        data = url + '\n' + json.dumps(sorted((headers or {}).items()))
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def load(self, key):
+        """
+        读取缓存，返回 (保存时间, CachedResponse) 或 None。
+        """
+        with self.lock:
+            if key in self.memory:
+                return self.memory[key]
+        if not self.cache_dir or not os.path.exists(self.cache_path(key)):
+            return None
+        try:
+            with open(self.cache_path(key), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        entry = (data['stored_at'], CachedResponse(data['url'], data['status_code'], data['headers'], data['text'], True))
+        with self.lock:
+            self.memory[key] = entry
+        return entry
+
+    def store(self, key, response):
+        stored_at = time.time()
+        with self.lock:
+            self.memory[key] = (stored_at, response)
+        if not self.cache_dir:
+            return
+        data = response.to_dict()
+        data['stored_at'] = stored_at
+        write_atomic(self.cache_path(key), json.dumps(data))
+
+    def evict(self):
+        """
+        删除超过max_age的磁盘缓存。
+        """
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def get_key_lock(self, key):
+        with self.lock:
+            if key not in self.key_locks:
+                self.key_locks[key] = threading.Lock()
+            return self.key_locks[key]
+
+    def request(self, url, headers=None):
+        """
+        实际发送GET请求。有rate_limiter时先等待额度，被限流时等待后重试。
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            response = self.session.get(url, headers=headers)
+            if self.rate_limiter is None or not self.rate_limiter.update(response.headers, response.status_code):
+                break
+        return response
+
+    def get(self, url, headers=None):
+        """
+        发送GET请求，优先使用缓存。
+
+        返回:
+            CachedResponse: 响应，from_cache表示内容是否来自缓存。
+        """
+        key = self.cache_key(url, headers)
+        with self.get_key_lock(key):
+            entry = self.load(key)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                return entry[1].cached_copy()
+
+            request_headers = dict(headers or {})
+            if entry is not None:
+                cached = entry[1]
+                if cached.headers.get('ETag'):
+                    request_headers['If-None-Match'] = cached.headers['ETag']
+                if cached.headers.get('Last-Modified'):
+                    request_headers['If-Modified-Since'] = cached.headers['Last-Modified']
+
+            response = self.request(url, headers=request_headers)
+            if response.status_code == 304 and entry is not None:
+                self.store(key, entry[1])
+                return entry[1].cached_copy()
+
+            result = CachedResponse(url, response.status_code,
+                                    {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers},
+                                    response.text)
+            if response.status_code in CACHEABLE_STATUS:
+                self.store(key, result)
+            return result
+
+
+# 进程内共用的客户端
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    返回共用的HttpClient，没有设置时创建一个只在内存中缓存的客户端。
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def set_client(client):
+    """
+    设置共用的HttpClient，例如带磁盘缓存的客户端，或测试时指向本地服务的客户端。
+    """
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,172 @@
+import os
+import json
+import fnmatch
+import hashlib
+from atomic_file import write_atomic
+from file_index import read_head
+from TestParser import classes_to_dicts, classes_from_dicts
+
+# 解析结果的格式版本，TestParser的输出变化时修改，旧的缓存自动失效
+CACHE_VERSION = 2
+
+
+def write_json(path, data):
+    """
+    原子地写入缓存文件，中断时不会留下不完整的缓存文件。
+    """
+    write_atomic(path, json.dumps(data))
+
+
+def read_json(path):
+    """
+    读取缓存文件，不存在或内容损坏时返回None。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+class MappingCache():
+    """
+    find_map_test_cases 的持久缓存。
+
+    - 每个文件的解析结果（TestParser.parse_file的输出：类、方法、调用）以git blob哈希为键保存，
+      内容相同的文件不论在哪个仓库、哪个版本都只解析一次
+    - 每个仓库的测试类和Java文件列表以HEAD为键保存，工作区干净且HEAD没有变化时不再grep和glob
+
+    参数:
+        root (str): 缓存目录。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def blob_path(self, blob_sha):
+        return os.path.join(self.root, 'v' + str(CACHE_VERSION), blob_sha[:2], blob_sha + '.json')
+
+    def load_classes(self, blob_sha):
+        """
+        返回某个blob的解析结果，没有缓存时返回None。
+        """
+        data = read_json(self.blob_path(blob_sha))
+        return classes_from_dicts(data) if data is not None else None
+
+    def store_classes(self, blob_sha, parsed_classes):
+        write_json(self.blob_path(blob_sha), classes_to_dicts(parsed_classes))
+
+    def files_path(self, repository):
+        key = hashlib.sha1(os.path.realpath(repository.path).encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'repos', key + '.json')
+
+    def load_files(self, repository, head):
+        """
+        返回HEAD为head时保存的 (测试类列表, Java文件列表)，没有时返回None。
+        """
+        data = read_json(self.files_path(repository))
+        if data is None or data.get('head') != head:
+            return None
+        return data['tests'], data['java']
+
+    def store_files(self, repository, head, tests, java):
+        write_json(self.files_path(repository), {'head': head, 'tests': tests, 'java': java})
+
+    def for_repository(self, repository, parser):
+        return RepositoryMappingCache(self, repository, parser)
+
+
+class RepositoryMappingCache():
+    """
+    一个仓库的缓存视图，提供与TestParser相同的parse_file方法，可以直接替代parser使用。
+
+    创建时读取一次 git ls-files -s（各文件的blob哈希）和 git status（工作区中被修改的文件），
+    被修改或未跟踪的文件内容与blob不一致，总是重新解析；
+    只有被修改或未跟踪的文件中有Java文件时，才不使用缓存的文件列表。
+    """
+
+    def __init__(self, cache, repository, parser):
+        self.cache = cache
+        self.repository = repository
+        self.parser = parser
+        self.hits = 0
+        self.misses = 0
+
+        self.head = read_head(repository)
+        self.blobs = {}
+        self.clean = False
+        if self.head is None:
+            return
+
+        status = repository.git('status', '--porcelain', '-z', '--untracked-files=all')
+        staged = repository.git('ls-files', '-s', '-z')
+        if status.returncode != 0 or staged.returncode != 0:
+            return
+
+        dirty = set()
+        entries = iter(status.stdout.split(b'\0'))
+        for entry in entries:
+            if not entry:
+                continue
+            dirty.add(os.fsdecode(entry[3:]))
+            if b'R' in entry[:2] or b'C' in entry[:2]:
+                dirty.add(os.fsdecode(next(entries, b'')))  # 重命名的原路径
+        # 文件列表只与Java文件有关，流程写入的 diff.txt 等其他文件不影响列表缓存
+        self.clean = not any(fnmatch.fnmatch(os.path.basename(path), '*.java') for path in dirty)
+
+        for entry in staged.stdout.split(b'\0'):
+            if not entry:
+                continue
+            info, path = entry.split(b'\t', 1)
+            mode, blob_sha, stage = info.split()
+            path = os.fsdecode(path)
+            if stage == b'0' and path not in dirty:
+                self.blobs[path] = blob_sha.decode('ascii')
+
+    def load_files(self):
+        """
+        返回缓存的 (测试类列表, Java文件列表)；工作区不干净或HEAD变化时返回None。
+        """
+        if not self.clean:
+            return None
+        return self.cache.load_files(self.repository, self.head)
+
+    def store_files(self, tests, java):
+        if self.clean:
+            self.cache.store_files(self.repository, self.head, tests, java)
+
+    def parse_files(self, files, parse_many):
+        """
+        解析多个文件，blob没有变化的文件直接使用缓存。
+
+        参数:
+            files (list): 文件的完整路径。
+            parse_many (callable): 解析未缓存文件的函数，接收文件列表，按顺序返回解析结果。
+
+        返回:
+            dict: 文件路径 -> 解析结果（TestParser.parse_file的输出）。
+        """
+        results = {}
+        missing = []
+        for file in files:
+            relative = os.path.relpath(file, self.repository.path).replace('\\', '/')
+            blob_sha = self.blobs.get(relative)
+            parsed_classes = self.cache.load_classes(blob_sha) if blob_sha is not None else None
+            if parsed_classes is not None:
+                self.hits += 1
+                results[file] = parsed_classes
+            else:
+                missing.append((file, blob_sha))
+
+        self.misses += len(missing)
+        for (file, blob_sha), parsed_classes in zip(missing, parse_many([file for file, _ in missing])):
+            if blob_sha is not None:
+                self.cache.store_classes(blob_sha, parsed_classes)
+            results[file] = parsed_classes
+        return results
+
+    def parse_file(self, file):
+        """
+        与TestParser.parse_file相同，blob没有变化时直接返回缓存的解析结果。
+        """
+        return self.parse_files([file], lambda files: [self.parser.parse_file(f) for f in files])[file]
@@ -0,0 +1,210 @@
+import re
+import bisect
+from tree_sitter import Language, Parser
+from repository import Repository
+
+# 方法和构造函数声明
+METHOD_QUERY = """
+(method_declaration) @method
+(constructor_declaration) @method
+"""
+
+# 匹配 @@ -a,b +c,d @@ 中的起始行号
+HUNK_RANGE_PATTERN = re.compile(r'^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@')
+
+# 已加载的语法库，每个语法文件只加载一次
+_languages = {}
+
+
+def load_language(grammar_file, language='java'):
+    """
+    加载tree-sitter语法库，同一个语法文件只加载一次。
+    """
+    key = (grammar_file, language)
+    if key not in _languages:
+        _languages[key] = Language(grammar_file, language)
+    return _languages[key]
+
+
+class MethodIntervalIndex():
+    """
+    Java文件中方法/构造函数的行区间索引。
+
+    嵌套的方法（匿名类、内部类中的方法）在建索引时被拆成互不重叠的区间，
+    每个区间对应最内层的方法，查询时只需一次二分查找。
+    """
+
+    def __init__(self, methods):
+        """
+        参数:
+            methods (list): (起始行, 结束行, 方法名)列表，行号从1开始，包含两端。
+        """
+        self.starts = []
+        self.ends = []
+        self.names = []
+
+        stack = []  # (结束行, 方法名)
+        cursor = 0
+        for start, end, name in sorted(methods, key=lambda m: (m[0], -m[1])):
+            # 先结束所有在start之前结束的方法
+            while stack and stack[-1][0] < start:
+                close_end, close_name = stack.pop()
+                self._add(cursor, close_end, close_name)
+                cursor = max(cursor, close_end + 1)
+            # 外层方法在内层方法开始之前的部分
+            if stack:
+                self._add(cursor, start - 1, stack[-1][1])
+            stack.append((end, name))
+            cursor = start
+        while stack:
+            close_end, close_name = stack.pop()
+            self._add(cursor, close_end, close_name)
+            cursor = max(cursor, close_end + 1)
+
+    def _add(self, start, end, name):
+        if start <= end:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.names.append(name)
+
+    def lookup(self, line):
+        """
+        返回包含给定行（从1开始）的最内层方法名，不在任何方法中时返回None。
+        """
+        i = bisect.bisect_right(self.starts, line) - 1
+        if i >= 0 and line <= self.ends[i]:
+            return self.names[i]
+        return None
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class MethodResolver():
+    """
+    用tree-sitter解析某个commit修改前后的Java文件，按行号定位修改块所在的方法。
+
+    每个(版本, 文件)只解析一次，结果保存为MethodIntervalIndex。
+    """
+
+    def __init__(self, repo_path, commit_hash, grammar_file='build/my-languages.so', language='java'):
+        self.repository = Repository(repo_path)
+        self.commit_hash = commit_hash
+        self.language = load_language(grammar_file, language)
+        self.parser = Parser()
+        self.parser.set_language(self.language)
+        self.query = self.language.query(METHOD_QUERY)
+        self.indexes = {}
+
+    def read_source(self, revision, path):
+        """
+        读取某个版本中的文件内容，读取失败返回None。
+        """
+        return self.repository.backend().read_blob(revision, path)
+
+    def build_index(self, source):
+        """
+        解析Java源码并建立方法的行区间索引。
+        """
+        tree = self.parser.parse(source)
+        methods = []
+        for node, _ in self.query.captures(tree.root_node):
+            name_node = node.child_by_field_name('name')
+            if name_node is None:
+                continue
+            name = name_node.text.decode('utf-8', errors='ignore')
+            methods.append((node.start_point[0] + 1, node.end_point[0] + 1, name))
+        return MethodIntervalIndex(methods)
+
+    def index_for(self, side, path):
+        """
+        获取修改前（side='-'）或修改后（side='+'）文件的索引，文件无法读取时返回None。
+        """
+        key = (side, path)
+        if key not in self.indexes:
+            revision = self.commit_hash + '^' if side == '-' else self.commit_hash
+            source = self.read_source(revision, path)
+            self.indexes[key] = self.build_index(source) if source is not None else None
+        return self.indexes[key]
+
+    def resolve(self, side, path, line, default=None):
+        """
+        返回修改行所在的方法名。
+
+        参数:
+            side (str): '+'表示新增行（修改后的行号），'-'表示删除行（修改前的行号）。
+            path (str): 文件在仓库中的路径。
+            line (int): 行号。
+            default: 文件无法读取时返回的值。
+
+        返回:
+            str: 方法名，不在任何方法中时返回None。
+        """
+        if path is None or line is None:
+            return default
+        index = self.index_for(side, path)
+        if index is None:
+            return default
+        return index.lookup(line)
+
+
+class DiffPositionTracker():
+    """
+    顺序读取diff时记录当前文件的路径以及每一行在修改前后文件中的行号。
+    """
+
+    def __init__(self):
+        self.old_path = None
+        self.new_path = None
+        self.old_line = 0
+        self.new_line = 0
+        self.in_header = False
+
+    def feed(self, line):
+        """
+        读入diff的下一行。
+
+        返回:
+            tuple: 对于修改行返回(side, path, 行号)，其他行返回None。
+        """
+        if line.startswith('diff --git'):
+            self.old_path = self.new_path = None
+            self.in_header = True
+            return None
+
+        if line.startswith('@@'):
+            self.in_header = False
+            match = HUNK_RANGE_PATTERN.match(line)
+            if match:
+                self.old_line = int(match.group(1))
+                self.new_line = int(match.group(2))
+            return None
+
+        if self.in_header:
+            if line.startswith('--- '):
+                self.old_path = self.strip_prefix(line[4:], 'a/')
+            elif line.startswith('+++ '):
+                self.new_path = self.strip_prefix(line[4:], 'b/')
+            return None
+
+        if line.startswith('+'):
+            position = ('+', self.new_path, self.new_line)
+            self.new_line += 1
+            return position
+        if line.startswith('-'):
+            position = ('-', self.old_path, self.old_line)
+            self.old_line += 1
+            return position
+        if line.startswith(' ') or line == '':
+            self.old_line += 1
+            self.new_line += 1
+        return None
+
+    @staticmethod
+    def strip_prefix(path, prefix):
+        path = path.rstrip('\t')
+        if path == '/dev/null':
+            return None
+        if path.startswith(prefix):
+            return path[len(prefix):]
+        return path
@@ -0,0 +1,118 @@
+import time
+import threading
+
+# 被限流时的响应状态码
+RATE_LIMITED_STATUS = {403, 429}
+
+
+class RateLimiter():
+    """
+    根据GitHub返回的 X-RateLimit-Remaining / X-RateLimit-Reset 调度请求的令牌桶。
+
+    - 剩余额度充足时请求不等待
+    - 剩余额度低于low_watermark时，把剩下的额度平均分配到重置之前的时间里
+    - 额度用完（只剩reserve）或被限流（403/429）时等待到重置时间或Retry-After
+    令牌数以响应头为准，每次响应后更新；多个线程共用一个实例。
+
+    参数:
+        limit (int): 每个周期的额度，收到X-RateLimit-Limit后以响应头为准。
+        reserve (int): 保留的额度，不会被用掉。
+        low_watermark (int): 剩余额度低于该值时开始均匀分配。
+        clock, sleep: 时间函数，测试时可以替换。
+    """
+
+    def __init__(self, limit=5000, reserve=10, low_watermark=200, clock=time.time, sleep=time.sleep):
+        self.limit = limit
+        self.tokens = limit
+        self.reserve = reserve
+        self.low_watermark = low_watermark
+        self.reset_at = None  # 额度重置的时间
+        self.blocked_until = 0  # 被限流时暂停到的时间
+        self.next_slot = 0  # 均匀分配时下一个请求可以发出的时间
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def wait_time(self, now, cost):
+        """
+        计算还需要等待的时间，调用时需持有锁。
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.reset_at is not None and now >= self.reset_at:
+            self.tokens = self.limit
+            self.reset_at = None
+        if cost == 0:
+            return 0
+        if self.tokens - cost < self.reserve:
+            # 额度用完，等待重置；不知道重置时间时不阻塞，等响应头更新
+            return self.reset_at - now if self.reset_at is not None else 0
+        if self.tokens <= self.low_watermark and self.reset_at is not None:
+            return self.next_slot - now
+        return 0
+
+    def acquire(self, cost=1):
+        """
+        等到可以发出请求为止。
+
+        参数:
+            cost (int): 消耗的额度；克隆等不消耗API额度的操作用0，只在被限流时等待。
+        """
+        while True:
+            with self.lock:
+                now = self.clock()
+                wait = self.wait_time(now, cost)
+                if wait <= 0:
+                    self.tokens -= cost
+                    if cost and self.tokens <= self.low_watermark and self.reset_at is not None:
+                        interval = (self.reset_at - now) / max(self.tokens - self.reserve, 1)
+                        self.next_slot = max(self.next_slot, now) + interval
+                    return
+            self.sleep(min(wait, 60))
+
+    def update(self, headers, status_code=200):
+        """
+        根据响应头更新剩余额度。
+
+        返回:
+            bool: 该响应是否是被限流的响应（需要重试）。
+        """
+        now = self.clock()
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        limit = headers.get('X-RateLimit-Limit')
+        retry_after = headers.get('Retry-After')
+
+        with self.lock:
+            if limit is not None:
+                self.limit = int(limit)
+            if remaining is not None:
+                self.tokens = int(remaining)
+            if reset is not None:
+                self.reset_at = float(reset)
+
+            if status_code not in RATE_LIMITED_STATUS:
+                return False
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + float(retry_after))
+                return True
+            if remaining is not None and int(remaining) == 0 and self.reset_at is not None:
+                self.blocked_until = max(self.blocked_until, self.reset_at)
+                return True
+            return False
+
+
+# 进程内共用的限速器
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    返回所有线程共用的RateLimiter。
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
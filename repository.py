@@ -0,0 +1,291 @@
+import os
+import mmap
+import fnmatch
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from git_backend import get_backend
+
+# 克隆方式
+CLONE_FULL = 'full'  # 完整克隆
+CLONE_BLOBLESS = 'blobless'  # 只下载提交和目录树，文件内容在用到时再下载
+CLONE_SPARSE = 'sparse'  # blobless，并且工作区只检出 *.java
+
+# branches_containing的结果缓存：(仓库路径, 分支引用状态) -> {commit: 分支列表}
+_branch_cache = {}
+_branch_cache_lock = threading.Lock()
+
+
+def clone(repository_url, path, mode=CLONE_FULL, sparse_patterns=('*.java',)):
+    """
+    克隆仓库到path。
+
+    blobless/sparse模式使用 --filter=blob:none，只下载提交和目录树；
+    读取文件内容（checkout、git diff、cat-file）时git会自动从远程按需下载缺少的blob。
+    sparse模式另外只在工作区检出sparse_patterns匹配的文件。
+    用 file:// 地址指向一个开启了 uploadpack.allowFilter 的本地裸仓库即可在本地测试。
+
+    参数:
+        repository_url (str): 仓库地址。
+        path (str): 克隆到的目录。
+        mode (str): CLONE_FULL、CLONE_BLOBLESS或CLONE_SPARSE。
+        sparse_patterns (tuple): sparse模式下检出的文件模式。
+
+    返回:
+        bool: 克隆是否成功。
+    """
+    if mode == CLONE_FULL:
+        return subprocess.run(['git', 'clone', repository_url, path]).returncode == 0
+
+    command = ['git', 'clone', '--filter=blob:none', repository_url, path]
+    if mode == CLONE_SPARSE:
+        command.insert(2, '--no-checkout')
+    if subprocess.run(command).returncode != 0:
+        return False
+    if mode == CLONE_SPARSE:
+        repository = Repository(path)
+        if repository.git('sparse-checkout', 'set', '--no-cone', *sparse_patterns).returncode != 0:
+            return False
+        return repository.git('checkout').returncode == 0
+    return True
+
+
+def list_directory(path):
+    """
+    按读取顺序返回目录项，目录无法读取时返回空列表。
+    """
+    try:
+        with os.scandir(path) as entries:
+            return list(entries)
+    except OSError:
+        return []
+
+
+# 小于该大小的文件直接读取，映射的开销比读取大
+MMAP_MIN_SIZE = 64 * 1024
+
+
+def file_contains(path, needle):
+    """
+    在文件内容中查找needle（大文件用mmap），文件为空或无法读取时返回False。
+    """
+    try:
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return False
+            if size < MMAP_MIN_SIZE:
+                return needle in file.read()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                return content.find(needle) != -1
+    except (OSError, ValueError):
+        return False
+
+
+class Repository():
+    """
+    本地仓库的句柄。
+
+    git命令通过 git -C 执行，其他命令（grep等）通过 cwd= 在仓库目录下执行，
+    文件查找使用绝对路径，不会调用os.chdir改变进程的当前目录，
+    因此可以在多个线程中同时操作不同的仓库。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def join(self, *parts):
+        """
+        返回仓库中某个相对路径对应的完整路径。
+        """
+        return os.path.join(self.path, *parts)
+
+    def run(self, command, **kwargs):
+        """
+        在仓库目录下执行命令并捕获输出。
+        """
+        kwargs.setdefault('capture_output', True)
+        return subprocess.run(command, cwd=self.path, **kwargs)
+
+    def backend(self):
+        """
+        返回该仓库的常驻git进程（git_backend.GitBackend），用于读取对象和生成diff。
+        """
+        return get_backend(self.path)
+
+    def git(self, *args, **kwargs):
+        """
+        在仓库中执行git命令，例如 repo.git('branch', '-a', '--contains', sha)。
+        """
+        kwargs.setdefault('capture_output', True)
+        return subprocess.run(['git', '-C', self.path, *args], **kwargs)
+
+    def walk_files(self, include='*.java'):
+        """
+        深度优先遍历仓库（不进入.git），按目录项的读取顺序返回匹配include的文件，
+        顺序与 grep -r 相同。
+
+        返回:
+            list: (相对于仓库根目录、以/分隔的路径, 路径中是否有以.开头的部分) 的列表。
+        """
+        files = []
+        stack = [(iter(list_directory(self.path)), '', False)]
+        while stack:
+            entries, prefix, hidden = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            is_hidden = hidden or entry.name.startswith('.')
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name != '.git':
+                    stack.append((iter(list_directory(entry.path)), prefix + entry.name + '/', is_hidden))
+            elif fnmatch.fnmatch(entry.name, include):
+                files.append((prefix + entry.name, is_hidden))
+        return files
+
+    def scan_files(self, needle=b'@Test', include='*.java', max_workers=8):
+        """
+        一次遍历同时找出内容中包含needle的文件和所有匹配include的文件，代替 grep -r 加 glob 两遍扫描。
+
+        每个文件（大文件用mmap映射）在字节中查找needle，使用线程池并发读取。
+        与原来的 glob('**/*.java') 一样，文件列表不包含以.开头的目录和文件；
+        与 grep 一样，包含needle的文件不受此限制。
+
+        返回:
+            tuple: (包含needle的文件, 所有文件)，均为相对于仓库根目录、以/分隔的路径。
+        """
+        files = self.walk_files(include)
+        paths = [self.join(relative) for relative, _ in files]
+        # 按块分给线程，避免每个小文件一个任务的调度开销
+        size = max(1, -(-len(paths) // (max_workers * 4)))
+        chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            found = [contains for chunk in executor.map(lambda chunk: [file_contains(path, needle) for path in chunk], chunks)
+                     for contains in chunk]
+        matching = [relative for (relative, _), contains in zip(files, found) if contains]
+        all_files = [relative for relative, hidden in files if not hidden]
+        return matching, all_files
+
+    def branch_refs(self):
+        """
+        列出本地和远程分支，顺序与 git branch -a 相同。
+
+        返回:
+            list: (显示名, 指向的commit)列表，例如 ('remotes/origin/HEAD -> origin/master', sha)。
+        """
+        result = self.git('for-each-ref', '--format=%(refname)%00%(objectname)%00%(symref)',
+                          'refs/heads', 'refs/remotes', text=True, check=True)
+        refs = []
+        for line in result.stdout.splitlines():
+            refname, objectname, symref = line.split('\0')
+            name = self.short_ref_name(refname, 'refs/heads/', 'refs/')
+            if symref:
+                name += ' -> ' + self.short_ref_name(symref, 'refs/heads/', 'refs/remotes/')
+            refs.append((name, objectname))
+        return refs
+
+    @staticmethod
+    def short_ref_name(refname, *prefixes):
+        for prefix in prefixes:
+            if refname.startswith(prefix):
+                return refname[len(prefix):]
+        return refname
+
+    def resolve_commits(self, commit_hashes):
+        """
+        用一次 git cat-file --batch-check 把（可能是缩写的）提交哈希解析为完整哈希。
+
+        返回:
+            dict: 输入的哈希 -> 完整哈希，不存在的提交对应None。
+        """
+        commit_hashes = list(commit_hashes)
+        request = ''.join(commit_hash + '^{commit}\n' for commit_hash in commit_hashes)
+        result = self.git('cat-file', '--batch-check', input=request, text=True, check=True)
+        resolved = {}
+        for commit_hash, line in zip(commit_hashes, result.stdout.splitlines()):
+            fields = line.split()
+            resolved[commit_hash] = fields[0] if len(fields) == 3 and fields[1] == 'commit' else None
+        return resolved
+
+    def branches_containing(self, commit_hashes):
+        """
+        批量查询包含各个提交的分支，结果与对每个提交执行 git branch -a --contains 相同。
+
+        只遍历一次提交历史：按拓扑顺序（子提交在父提交之前）读取 git rev-list --parents，
+        把每个分支对应的位沿父提交传递，读到某个提交时它的位集合就是包含它的分支。
+        结果按(仓库, 分支引用状态)缓存，分支不变时重复查询不会再遍历历史。
+
+        参数:
+            commit_hashes (iterable): 提交哈希。
+
+        返回:
+            dict: 提交哈希 -> 分支名列表，不存在的提交对应None。
+        """
+        commit_hashes = list(dict.fromkeys(commit_hashes))
+        refs = self.branch_refs()
+        state = hashlib.sha1(repr(refs).encode('utf-8')).hexdigest()
+        cache_key = (os.path.realpath(self.path), state)
+
+        with _branch_cache_lock:
+            cached = dict(_branch_cache.get(cache_key, {}))
+        missing = [commit_hash for commit_hash in commit_hashes if commit_hash not in cached]
+
+        if missing:
+            resolved = self.resolve_commits(missing)
+            targets = {sha for sha in resolved.values() if sha is not None}
+            masks = self.reachable_masks(refs, targets)
+            for commit_hash, sha in resolved.items():
+                if sha is None:
+                    cached[commit_hash] = None
+                else:
+                    mask = masks.get(sha, 0)
+                    cached[commit_hash] = [name for bit, (name, _) in enumerate(refs) if mask >> bit & 1]
+            with _branch_cache_lock:
+                # 分支状态变化后旧的结果不再有效
+                for key in [key for key in _branch_cache if key[0] == cache_key[0] and key != cache_key]:
+                    del _branch_cache[key]
+                _branch_cache.setdefault(cache_key, {}).update(cached)
+
+        return {commit_hash: cached[commit_hash] for commit_hash in commit_hashes}
+
+    def reachable_masks(self, refs, targets):
+        """
+        计算每个目标提交能被哪些分支到达，第i位对应refs[i]。
+        """
+        masks = {}
+        for bit, (_, objectname) in enumerate(refs):
+            masks[objectname] = masks.get(objectname, 0) | (1 << bit)
+        result = {}
+        if not targets or not masks:
+            return result
+
+        # 分支很多时命令行会过长，起点通过标准输入传入
+        process = subprocess.Popen(['git', '-C', self.path, 'rev-list', '--topo-order', '--parents', '--stdin'],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            process.stdin.write(''.join(objectname + '\n' for objectname in masks))
+            process.stdin.close()
+            for line in process.stdout:
+                commit, *parents = line.split()
+                # 拓扑顺序保证此时所有子提交都已处理完，mask已经是最终结果
+                mask = masks.pop(commit, 0)
+                for parent in parents:
+                    masks[parent] = masks.get(parent, 0) | mask
+                if commit in targets:
+                    result[commit] = mask
+                    if len(result) == len(targets):
+                        break
+        finally:
+            process.stdout.close()
+            process.kill()
+            process.wait()
+        return result
@@ -0,0 +1,114 @@
+import re
+
+# 参数中的注解，例如 @NonNull、@Param("id")
+ANNOTATION_PATTERN = re.compile(r'@[\w.]+(\s*\([^()]*\))?')
+# 参数名及其后面的数组维度，例如 args、values[]
+PARAM_NAME_PATTERN = re.compile(r'([\w$]+)\s*((?:\[\s*\]\s*)*)$')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_type(type_text):
+    """
+    去掉类型中的所有空白，例如 'Map<String, Integer>' -> 'Map<String,Integer>'。
+    """
+    return WHITESPACE_PATTERN.sub('', type_text)
+
+
+def split_parameters(params):
+    """
+    按最外层的逗号拆分参数列表（泛型、注解参数中的逗号不拆分）。
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(params):
+        if char in '<([':
+            depth += 1
+        elif char in '>)]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(params[start:i])
+            start = i + 1
+    parts.append(params[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parameter_type(param):
+    """
+    返回一个参数声明的类型，去掉注解、final和参数名，例如 'final int values[]' -> 'int[]'。
+    """
+    param = ANNOTATION_PATTERN.sub(' ', param)
+    param = ' '.join(token for token in param.split() if token != 'final')
+    match = PARAM_NAME_PATTERN.search(param)
+    if match is None or not param[:match.start()].strip():
+        return normalize_type(param)  # 只有类型没有参数名
+    return normalize_type(param[:match.start()] + match.group(2))
+
+
+def canonical_signature(signature):
+    """
+    把方法签名转换为规范的键 (返回类型, 方法名, 参数类型元组)。
+
+    export_mtc 和 extract_method_signatures 生成的签名格式不完全相同（空白、换行、参数名），
+    转换后只比较返回类型、方法名和参数类型。
+
+    参数:
+        signature (str): 方法签名，例如 'List<String> find(int id, String... names)'。
+
+    返回:
+        tuple: (返回类型, 方法名, 参数类型元组)，无法解析时返回None。
+    """
+    open_index = signature.find('(')
+    close_index = signature.rfind(')')
+    if open_index == -1 or close_index < open_index:
+        return None
+    head = signature[:open_index].strip()
+    if not head:
+        return None
+    name = head.split()[-1]
+    return_type = normalize_type(head[:len(head) - len(name)])
+    params = signature[open_index + 1:close_index]
+    return return_type, name, tuple(parameter_type(param) for param in split_parameters(params))
+
+
+class SignatureIndex():
+    """
+    一个仓库中有测试用例的焦点方法签名的索引。
+
+    以 canonical_signature 的规范键保存，每个仓库建立一次：
+    - 判断签名是否存在为O(1)，与签名的空白、换行和参数名无关
+    - 可以按方法名或按 (方法名, 参数个数) 查找
+
+    参数:
+        signatures (iterable): 方法签名，例如 _signature.json 的内容。
+    """
+
+    def __init__(self, signatures=()):
+        self.keys = set()
+        self.names = {}  # 方法名 -> 签名列表
+        self.arities = {}  # (方法名, 参数个数) -> 签名列表
+        for signature in signatures:
+            self.add(signature)
+
+    def add(self, signature):
+        key = canonical_signature(signature)
+        if key is None or key in self.keys:
+            return
+        self.keys.add(key)
+        self.names.setdefault(key[1], []).append(signature)
+        self.arities.setdefault((key[1], len(key[2])), []).append(signature)
+
+    def __contains__(self, signature):
+        key = canonical_signature(signature)
+        return key is not None and key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, name, arity=None):
+        """
+        返回方法名为name（且参数个数为arity）的签名列表。
+        """
+        if arity is None:
+            return list(self.names.get(name, []))
+        return list(self.arities.get((name, arity), []))
@@ -0,0 +1,24 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import data_processing
+from data_processing import iter_diff_lines, process_diff_output
+
+
+def test_iter_diff_lines_splits_like_splitlines():
+    text = 'a\nb\r\nc\rd\x0be\x0cf\x1cg\x1dh\x1ei\x85j k l\n\nm'
+    assert list(iter_diff_lines(text)) == text.splitlines()
+    assert list(iter_diff_lines('')) == []
+    assert list(iter_diff_lines('\n')) == ['']
+
+
+def test_form_feed_starts_a_new_line(monkeypatch):
+    monkeypatch.setattr(data_processing, 'count_test_files', lambda repo_path: False)
+    # 表单换页符（\x0c）后的 @@ 行与 splitlines() 一样被当作新的一行
+    diff = 'diff --git a/A.java b/A.java\n@@ -1,2 +1,2 @@ void foo(\n-a\x0c@@ -5,2 +5,2 @@ void foo(\n+b\n'
+    datas = process_diff_output('repo', diff)
+    assert datas['hunk'] == 2
+    assert datas['function_name'] == ['void foo', 'void foo']
@@ -0,0 +1,165 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from diff_parser import ADDED, DELETED, MODIFIED, RENAMED, PathIndex, parse_diff, unquote_path
+
+
+def git(repo, *args):
+    return subprocess.run(['git', '-C', str(repo), '-c', 'user.name=a', '-c', 'user.email=a@a',
+                           '-c', 'core.quotepath=true', *args],
+                          check=True, capture_output=True).stdout.decode('utf-8')
+
+
+def write(repo, path, content):
+    path = repo / path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding='utf-8')
+
+
+def baseline_java_file_paths(diff_output):
+    """
+    原来的 extract_java_file_paths：在整个diff上匹配 a/、b/ 开头的路径
+    """
+    matches = re.findall(r'(?:a/|b/)([^ \t\n\r\f\v]+)', diff_output)
+    return set(path for path in matches if path.endswith('.java'))
+
+
+def java_paths(changes):
+    return set(path for change in changes for path in change.paths if path.endswith('.java'))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, 'init', '-q')
+    write(tmp_path, 'src/p/A.java', 'class A {\n    int x;\n}\n')
+    write(tmp_path, 'src/p/B.java', 'class B {}\n' * 20)
+    write(tmp_path, 'src/p/Old.java', 'class Old { void m() {} }\n' * 10)
+    write(tmp_path, 'README.md', 'readme\n')
+    git(tmp_path, 'add', '-A')
+    git(tmp_path, 'commit', '-qm', 'init')
+    return tmp_path
+
+
+def commit_diff(repo):
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-qm', 'change')
+    return git(repo, 'diff', '-M', 'HEAD~1', 'HEAD')
+
+
+def test_plain_paths_match_baseline(repo):
+    write(repo, 'src/p/A.java', 'class A {\n    int y;\n}\n')
+    os.remove(str(repo / 'src/p/B.java'))
+    write(repo, 'src/p/C.java', 'class C {}\n')
+    write(repo, 'README.md', 'changed\n')
+    git(repo, 'mv', 'src/p/Old.java', 'src/p/New.java')
+    diff = commit_diff(repo)
+
+    changes = list(parse_diff(diff.splitlines()))
+    assert java_paths(changes) == baseline_java_file_paths(diff)
+    by_path = {change.path: change for change in changes}
+    assert by_path['src/p/A.java'].status == MODIFIED
+    assert by_path['src/p/A.java'].hunks == [(1, 3, 1, 3)]
+    assert by_path['src/p/B.java'].status == DELETED and by_path['src/p/B.java'].new_path is None
+    assert by_path['src/p/C.java'].status == ADDED and by_path['src/p/C.java'].old_path is None
+    assert by_path['src/p/New.java'].status == RENAMED
+    assert by_path['src/p/New.java'].old_path == 'src/p/Old.java'
+    assert by_path['README.md'].status == MODIFIED
+
+
+def test_renamed_path_with_spaces(repo):
+    # 原来的正则在空格处截断路径，得到 'src/p/My' 这样的片段
+    write(repo, 'src/p/Old.java', 'class Old { void m() {} }\n' * 9 + 'class Extra {}\n')
+    git(repo, 'mv', 'src/p/Old.java', 'src/p/My Old.java')
+    diff = commit_diff(repo)
+
+    [change] = parse_diff(diff.splitlines())
+    assert change.status == RENAMED
+    assert (change.old_path, change.new_path) == ('src/p/Old.java', 'src/p/My Old.java')
+    assert 'src/p/My Old.java' not in baseline_java_file_paths(diff)
+
+
+def test_quoted_non_ascii_path(repo):
+    write(repo, 'src/p/Grüße b.java', 'class G {}\n')
+    diff = commit_diff(repo)
+
+    assert '"b/src/p/Gr\\303\\274\\303\\237e b.java"' in diff
+    [change] = parse_diff(diff.splitlines())
+    assert change.status == ADDED
+    assert change.new_path == 'src/p/Grüße b.java'
+    assert change.new_path not in baseline_java_file_paths(diff)
+
+
+def test_code_lines_are_not_headers(repo):
+    # 代码行中形如文件头或 a/x.java 的内容不是修改的文件
+    write(repo, 'src/p/A.java', 'class A {\n-- a/fake/Evil.java\n++ b/x.java\ndiff --git a/q.java b/q.java\n'
+                                'String s = "a/Path.java";\n}\n')
+    diff = commit_diff(repo)
+
+    changes = list(parse_diff(diff.splitlines()))
+    assert [change.path for change in changes] == ['src/p/A.java']
+    assert java_paths(changes) == {'src/p/A.java'}
+    assert 'fake/Evil.java' in baseline_java_file_paths(diff)
+
+
+def test_no_newline_marker_and_file_input(repo, tmp_path):
+    (repo / 'src/p/A.java').write_bytes(b'class A {}')
+    write(repo, 'src/p/C.java', 'class C {}\n')
+    diff = commit_diff(repo)
+    diff_file = tmp_path / 'commit.diff'
+    diff_file.write_text(diff, encoding='utf-8')
+
+    with open(str(diff_file), encoding='utf-8') as file:
+        changes = list(parse_diff(file))
+    assert [change.path for change in changes] == ['src/p/A.java', 'src/p/C.java']
+
+
+def test_unquote_path():
+    assert unquote_path('"a/\\303\\244 \\"x\\".java"') == 'a/ä "x".java'
+    assert unquote_path('a/plain.java') == 'a/plain.java'
+
+
+PATHS = ['core/src/main/java/com/x/A.java', 'api/src/main/java/com/y/A.java', 'core/src/main/java/com/x/MyA.java',
+         'B.java', 'core/src/test/java/com/x/ATest.java']
+
+
+def test_path_index_finds_every_file_with_the_name():
+    index = PathIndex(PATHS)
+    assert index.lookup('A.java') == ['core/src/main/java/com/x/A.java', 'api/src/main/java/com/y/A.java']
+    assert index.lookup('B.java') == ['B.java']
+    assert index.lookup('C.java') == []
+    assert len(index) == len(PATHS)
+
+
+def test_path_index_matches_whole_names_only():
+    # 原来的 path.endswith(java_file) 会把 MyA.java 也当成 A.java
+    index = PathIndex(PATHS)
+    baseline = [path for path in PATHS if path.endswith('A.java')]
+    assert 'core/src/main/java/com/x/MyA.java' in baseline
+    assert 'core/src/main/java/com/x/MyA.java' not in index.lookup('A.java')
+    assert index.lookup('MyA.java') == ['core/src/main/java/com/x/MyA.java']
+
+
+def test_path_index_package_qualified_suffix():
+    index = PathIndex(PATHS)
+    assert index.lookup('com/x/A.java') == ['core/src/main/java/com/x/A.java']
+    assert index.lookup('y/A.java') == ['api/src/main/java/com/y/A.java']
+    assert index.lookup('/com/y/A.java') == ['api/src/main/java/com/y/A.java']
+    assert index.lookup('z/A.java') == []
+    assert index.lookup('core/src/main/java/com/x/A.java') == ['core/src/main/java/com/x/A.java']
+    assert index.lookup('x/core/src/main/java/com/x/A.java') == []
+
+
+def test_path_index_from_parsed_diff(repo):
+    write(repo, 'src/q/A.java', 'class A {}\n')
+    write(repo, 'src/p/A.java', 'class A {\n    int y;\n}\n')
+    diff = commit_diff(repo)
+
+    paths = sorted(java_paths(parse_diff(diff.splitlines())))
+    assert sorted(PathIndex(paths).lookup('A.java')) == ['src/p/A.java', 'src/q/A.java']
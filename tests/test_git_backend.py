@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from git_backend import GitBackend
+
+
+def git(repo, *args):
+    return subprocess.run(['git', '-C', str(repo), '-c', 'user.name=a', '-c', 'user.email=a@a', *args],
+                          check=True, capture_output=True, text=True).stdout
+
+
+def test_missing_object_with_space_in_name(tmp_path):
+    git(tmp_path, 'init', '-q')
+    (tmp_path / 'a b.txt').write_text('x\n')
+    git(tmp_path, 'add', '-A')
+    git(tmp_path, 'commit', '-qm', 'init')
+
+    backend = GitBackend(str(tmp_path))
+    try:
+        # cat-file 回复 "HEAD:no such missing"，同样是三个字段
+        assert backend.read_object('HEAD:no such') is None
+        # 进程中没有残留的输出，之后的请求正常
+        assert backend.read_blob('HEAD', 'a b.txt') == b'x\n'
+        assert backend.read_blob('HEAD', 'missing file') is None
+    finally:
+        backend.close()
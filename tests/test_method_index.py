@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip('tree_sitter')
+
+from method_index import MethodIntervalIndex
+
+
+def intervals(index):
+    return list(zip(index.starts, index.ends, index.names))
+
+
+def brute_force(methods, line):
+    """
+    最内层方法：包含该行的区间中起始行最大的一个。
+    """
+    containing = [m for m in methods if m[0] <= line <= m[1]]
+    if not containing:
+        return None
+    return max(containing, key=lambda m: (m[0], -m[1]))[2]
+
+
+def test_disjoint_methods():
+    index = MethodIntervalIndex([(10, 12, 'b'), (2, 5, 'a')])
+    assert intervals(index) == [(2, 5, 'a'), (10, 12, 'b')]
+    assert [index.lookup(line) for line in (1, 2, 5, 6, 10, 12, 13)] == [None, 'a', 'a', None, 'b', 'b', None]
+
+
+def test_nested_methods_are_flattened():
+    # 外层方法中的匿名类有两个方法
+    methods = [(1, 20, 'outer'), (4, 6, 'run'), (9, 12, 'call'), (10, 11, 'inner')]
+    index = MethodIntervalIndex(methods)
+    assert intervals(index) == [(1, 3, 'outer'), (4, 6, 'run'), (7, 8, 'outer'), (9, 9, 'call'),
+                                (10, 11, 'inner'), (12, 12, 'call'), (13, 20, 'outer')]
+    # 拆分后的区间互不重叠
+    assert all(end < start for end, start in zip(index.ends, index.starts[1:]))
+
+
+def test_nested_method_sharing_boundaries():
+    # 内层方法与外层方法在同一行开始或结束
+    index = MethodIntervalIndex([(1, 8, 'outer'), (1, 2, 'first'), (6, 8, 'last')])
+    assert intervals(index) == [(1, 2, 'first'), (3, 5, 'outer'), (6, 8, 'last')]
+
+
+def test_matches_innermost_method():
+    methods = [(1, 40, 'a'), (3, 10, 'b'), (5, 6, 'c'), (12, 30, 'd'), (12, 14, 'e'),
+               (20, 29, 'f'), (25, 25, 'g'), (45, 50, 'h'), (47, 47, 'i')]
+    index = MethodIntervalIndex(methods)
+    for line in range(0, 55):
+        assert index.lookup(line) == brute_force(methods, line), line
+
+
+def test_empty_index():
+    index = MethodIntervalIndex([])
+    assert len(index) == 0
+    assert index.lookup(1) is None
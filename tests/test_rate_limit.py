@@ -0,0 +1,118 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rate_limit import RateLimiter
+
+
+class FakeClock():
+    """
+    可控的时钟，sleep只推进时间并记录等待的秒数。
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(clock, **kwargs):
+    return RateLimiter(clock=clock.time, sleep=clock.sleep, **kwargs)
+
+
+def test_plenty_of_tokens_does_not_wait():
+    clock = FakeClock()
+    limiter = make_limiter(clock, limit=5000)
+    for _ in range(100):
+        limiter.acquire()
+    assert clock.sleeps == []
+    assert limiter.tokens == 4900
+
+
+def test_headers_override_local_count():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    limiter.acquire()
+    limited = limiter.update({'X-RateLimit-Limit': '60', 'X-RateLimit-Remaining': '42',
+                              'X-RateLimit-Reset': '1500'})
+    assert not limited
+    assert (limiter.limit, limiter.tokens, limiter.reset_at) == (60, 42, 1500.0)
+
+
+def test_exhausted_bucket_waits_for_reset_and_refills():
+    clock = FakeClock()
+    limiter = make_limiter(clock, limit=100, reserve=10, low_watermark=0)
+    limiter.update({'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': str(clock.now + 30)})
+    limiter.acquire()
+    assert clock.sleeps == [30]
+    # 到达重置时间后额度恢复为limit
+    assert limiter.tokens == 99
+    assert limiter.reset_at is None
+
+
+def test_long_waits_are_split_into_slices():
+    clock = FakeClock()
+    limiter = make_limiter(clock, limit=100, reserve=10, low_watermark=0)
+    limiter.update({'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': str(clock.now + 150)})
+    limiter.acquire()
+    assert clock.sleeps == [60, 60, 30]
+
+
+def test_exhausted_without_reset_time_does_not_block():
+    clock = FakeClock()
+    limiter = make_limiter(clock, limit=100, reserve=10)
+    limiter.update({'X-RateLimit-Remaining': '10'})
+    limiter.acquire()
+    assert clock.sleeps == []
+
+
+def test_low_watermark_spreads_remaining_tokens_until_reset():
+    clock = FakeClock()
+    limiter = make_limiter(clock, limit=5000, reserve=10, low_watermark=200)
+    limiter.update({'X-RateLimit-Remaining': '110', 'X-RateLimit-Reset': str(clock.now + 100)})
+    limiter.acquire()
+    assert clock.sleeps == []
+    limiter.acquire()
+    # 剩下的109 - 10个额度平均分配到100秒里
+    assert clock.sleeps == [pytest.approx(100 / 99)]
+
+
+def test_retry_after_blocks_every_request():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    assert limiter.update({'Retry-After': '5'}, status_code=429)
+    # 不消耗额度的操作（克隆）也要等待
+    limiter.acquire(cost=0)
+    assert clock.sleeps == [5]
+    limiter.acquire()
+    assert clock.sleeps == [5]
+
+
+def test_forbidden_with_no_remaining_waits_until_reset():
+    clock = FakeClock()
+    limiter = make_limiter(clock, limit=5000)
+    limited = limiter.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(clock.now + 20)},
+                             status_code=403)
+    assert limited
+    limiter.acquire()
+    assert clock.sleeps == [20]
+    assert limiter.tokens == 4999
+
+
+def test_forbidden_without_rate_limit_headers_is_not_retried():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    assert not limiter.update({}, status_code=403)
+    assert not limiter.update({'X-RateLimit-Remaining': '3000'}, status_code=403)
+    limiter.acquire()
+    assert clock.sleeps == []
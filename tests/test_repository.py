@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from repository import Repository
+
+
+def git(repo, *args):
+    return subprocess.run(['git', '-C', str(repo), '-c', 'user.name=a', '-c', 'user.email=a@a', *args],
+                          check=True, capture_output=True, text=True).stdout
+
+
+def commit(repo, name):
+    (repo / (name + '.txt')).write_text(name)
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-qm', name)
+
+
+def branch_contains(repo, commit_hash):
+    """
+    原来的实现：解析 git branch -a --contains 的输出
+    """
+    output = git(repo, 'branch', '-a', '--contains', commit_hash)
+    return [branch.strip().replace('* ', '') for branch in output.strip().split('\n') if branch.strip()]
+
+
+@pytest.fixture
+def clone(tmp_path):
+    """
+    上游仓库有master、feature（已合并）和release三个分支，克隆后再建一个本地分支
+    """
+    origin = tmp_path / 'origin'
+    origin.mkdir()
+    git(origin, 'init', '-q', '-b', 'master')
+    commit(origin, 'root')
+    git(origin, 'checkout', '-q', '-b', 'feature')
+    commit(origin, 'feature1')
+    commit(origin, 'feature2')
+    git(origin, 'checkout', '-q', 'master')
+    commit(origin, 'master1')
+    git(origin, 'merge', '-q', '--no-ff', '-m', 'merge', 'feature')
+    git(origin, 'checkout', '-q', '-b', 'release', 'HEAD~1')
+    commit(origin, 'release1')
+    git(origin, 'checkout', '-q', 'master')
+
+    clone = tmp_path / 'clone'
+    subprocess.run(['git', 'clone', '-q', str(origin), str(clone)], check=True)
+    git(clone, 'checkout', '-q', '-b', 'local', 'origin/feature')
+    commit(clone, 'local1')
+    git(clone, 'checkout', '-q', 'master')
+    return clone
+
+
+def test_branches_containing_matches_git_branch_contains(clone):
+    commits = git(clone, 'rev-list', '--all').split()
+    branches = Repository(str(clone)).branches_containing(commits)
+    for commit_hash in commits:
+        assert branches[commit_hash] == branch_contains(clone, commit_hash), commit_hash
+
+
+def test_branches_containing_abbreviated_and_unknown_commits(clone):
+    head = git(clone, 'rev-parse', 'HEAD').strip()
+    unknown = '0' * 40
+    branches = Repository(str(clone)).branches_containing([head[:10], unknown])
+    assert branches[head[:10]] == branch_contains(clone, head)
+    assert branches[unknown] is None
+
+
+def test_branches_containing_sees_new_branches(clone):
+    repository = Repository(str(clone))
+    head = git(clone, 'rev-parse', 'HEAD').strip()
+    before = repository.branches_containing([head])[head]
+    git(clone, 'branch', 'extra')
+    after = repository.branches_containing([head])[head]
+    assert 'extra' not in before
+    assert after == branch_contains(clone, head)
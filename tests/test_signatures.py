@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from signature_index import SignatureIndex, canonical_signature
+
+GRAMMAR = os.path.join(ROOT, 'build', 'my-languages.so')
+
+
+def grammar_candidates():
+    """
+    仓库自带的语法文件是Windows下编译的，其他平台上改用 tree_sitter_java 包中编译好的语法
+    （该扩展模块同样导出了 tree_sitter_java 符号，可以按路径加载）。
+    """
+    yield GRAMMAR
+    try:
+        import tree_sitter_java._binding as binding
+    except ImportError:
+        return
+    yield binding.__file__
+
+FOCAL_CLASS = '''package p;
+
+public class Joiner {
+    public void m2(String... names) { }
+    public int sum(final int xs[], int[]... rest) { return 0; }
+}
+'''
+
+TEST_CLASS = '''package p;
+
+import org.junit.Test;
+
+public class JoinerTest {
+    @Test
+    public void testM2() { Joiner joiner = new Joiner(); joiner.m2("a", "b"); }
+
+    @Test
+    public void testSum() { Joiner joiner = new Joiner(); joiner.sum(new int[0]); }
+}
+'''
+
+
+@pytest.fixture
+def grammar():
+    tree_sitter = pytest.importorskip('tree_sitter')
+    errors = []
+    for path in grammar_candidates():
+        try:
+            tree_sitter.Language(path, 'java')
+        except OSError as error:
+            errors.append(str(error))
+            continue
+        return path
+    pytest.skip('tree-sitter grammar cannot be loaded here: {}'.format('; '.join(errors)))
+
+
+@pytest.fixture
+def toolkit(grammar):
+    dpt = pytest.importorskip('data_processing_testcase')
+    return dpt.get_java_toolkit(grammar)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def test_exported_and_extracted_signatures_share_keys(tmp_path, grammar, toolkit):
+    from find_map_test_cases import focal_method_signatures
+    from data_processing_testcase import extract_method_signatures, method_exists
+
+    focal_file = str(tmp_path / 'core' / 'src' / 'main' / 'java' / 'p' / 'Joiner.java')
+    write(focal_file, FOCAL_CLASS)
+    write(str(tmp_path / 'core' / 'src' / 'test' / 'java' / 'p' / 'JoinerTest.java'), TEST_CLASS)
+
+    exported = focal_method_signatures(str(tmp_path), 'joiner', grammar)
+    extracted = extract_method_signatures(focal_file, toolkit)
+
+    assert sorted(map(canonical_signature, exported)) == sorted(map(canonical_signature, extracted))
+    assert ('void', 'm2', ('String...',)) in map(canonical_signature, extracted)
+    assert ('int', 'sum', ('int[]', 'int[]...')) in map(canonical_signature, extracted)
+
+    index = SignatureIndex(exported)
+    assert all(method_exists(index, signature) for signature in extracted)
+    # 可变参数方法不能匹配同名的无参方法
+    assert not method_exists(index, 'void m2()')